@@ -5,114 +5,70 @@ if sys.platform.startswith("win"):
 
 import streamlit as st
 import pandas as pd
-import csv
-import io
-import time
-from openpyxl.styles import Font, Alignment
-from scraper3 import get_company_details
-from llm3 import analyze_company_website
+import cache
+import content_select
+import export
+from llm3 import DEFAULT_BATCH_TOKEN_BUDGET
+from enrichment import EnrichmentJob, DEFAULT_LOOKUP_WORKERS, DEFAULT_ANALYSIS_WORKERS
 
 SAMPLE_FILE_PATH = "sample_input.csv"  # <-- Make sure this file exists
+POLL_SECONDS = 2  # how often a running job's table and progress are refreshed
+MAX_FINISHED_JOBS = 8
+
+def session_jobs():
+    """This browser session's jobs by input fingerprint; other sessions can't see or stop them."""
+    return st.session_state.setdefault("enrichment_jobs", {})
+
+def start_job(key, df, settings):
+    jobs = session_jobs()
+    finished = [k for k, job in jobs.items() if not job.running]
+    for old_key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+        del jobs[old_key]
+    job = EnrichmentJob(df, **settings).start()
+    jobs[key] = job
+    return job
+
+def show_results(job):
+    result_df = job.snapshot()
+    st.subheader("📊 Enrichment Results")
+    st.dataframe(result_df)
+
+    st.markdown("---")
+
+    partial = "" if job.done == job.total else f" ({job.done}/{job.total} rows)"
+    # Built only when clicked, so a running job's table refreshes stay cheap.
+    st.download_button(
+        label=f"⬇️ Download enriched CSV{partial}",
+        data=lambda: dataframe_to_csv_download(result_df),
+        file_name="enriched_companies.csv",
+        mime="text/csv"
+    )
 
-def enrich_companies(df):
-    for col in ['Website', 'Industry', 'Company Size', 'HQ Location', 'Summary', 'Target Customer', 'AI Automation Idea']:
-        if col not in df.columns:
-            df[col] = 'N/A'
-
-    websites, industries, sizes, locations = [], [], [], []
-    summaries, customers, ideas = [], [], []
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    total = len(df)
-    for idx, row in df.iterrows():
-        company = row['company_name']
-        status_text.write(f"🔍 Fetching & analyzing: **{company}** ({idx + 1}/{total})")
-        progress_bar.progress((idx + 1) / total)
-        time.sleep(0.1)
-
-        if (pd.isna(row['Website']) or row['Website'] == 'N/A' or
-            pd.isna(row['Industry']) or row['Industry'] == 'N/A' or
-            pd.isna(row['Company Size']) or row['Company Size'] == 'N/A' or
-            pd.isna(row['HQ Location']) or row['HQ Location'] == 'N/A'):
-            details = get_company_details(company)
-        else:
-            details = {
-                'Company Name': company,
-                'Website': row['Website'],
-                'Industry': row['Industry'],
-                'Company Size': row['Company Size'],
-                'HQ Location': row['HQ Location']
-            }
-
-        websites.append(details['Website'])
-        industries.append(details['Industry'])
-        sizes.append(details['Company Size'])
-        locations.append(details['HQ Location'])
-
-        if details['Website'] != 'N/A':
-            summary, customer, idea = analyze_company_website(details['Website'], company)
-        else:
-            summary, customer, idea = "N/A", "N/A", "N/A"
-
-        summaries.append(summary)
-        customers.append(customer)
-        ideas.append(idea)
-
-    status_text.empty()
-    progress_bar.empty()
-
-    df['Website'] = websites
-    df['Industry'] = industries
-    df['Company Size'] = sizes
-    df['HQ Location'] = locations
-    df['Summary'] = summaries
-    df['Target Customer'] = customers
-    df['AI Automation Idea'] = ideas
-
-    return df
-
-def dataframe_to_csv_download(df):
-    output = io.StringIO()
-    writer = csv.writer(output, quoting=csv.QUOTE_ALL)
+    st.download_button(
+        label=f"⬇️ Download enriched Excel (.xlsx){partial}",
+        data=lambda: dataframe_to_excel_download(result_df),
+        file_name="enriched_companies.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
 
-    writer.writerow(df.columns)
-    for _, row in df.iterrows():
-        cleaned_row = [str(cell).replace('\r', '') for cell in row]
-        writer.writerow(cleaned_row)
+@st.fragment(run_every=POLL_SECONDS)
+def show_running_job(job):
+    if not job.running:
+        # Switch to the static view (no more polling).
+        st.rerun()
+    current = f" — latest: **{job.current}**" if job.current else ""
+    st.progress(job.done / max(job.total, 1), text=f"🔍 Enriched {job.done}/{job.total} companies{current}")
+    if job.cancelled:
+        st.info("⏹️ Stopping after the companies already in progress (their results are kept)...")
+    elif st.button("⏹️ Stop enrichment"):
+        job.cancel()
+    show_results(job)
 
-    return output.getvalue().encode('utf-8')
+def dataframe_to_csv_download(df):
+    return export.export_bytes(df, "csv")
 
 def dataframe_to_excel_download(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Enriched Data')
-
-        workbook = writer.book
-        worksheet = writer.sheets['Enriched Data']
-
-        
-        header_font = Font(bold=True)
-        for cell in worksheet[1]:
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center')
-
-        for col in worksheet.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    cell_value = str(cell.value)
-                    if cell_value:
-                        max_length = max(max_length, len(cell_value))
-                except:
-                    pass
-            adjusted_width = max_length + 2
-            worksheet.column_dimensions[column].width = adjusted_width
-
-    output.seek(0)
-    return output.read()
+    return export.export_bytes(df, "xlsx")
 
 def main():
     st.set_page_config(page_title="Lead Enrichment Tool", layout="wide")
@@ -148,6 +104,36 @@ def main():
             except Exception as e:
                 st.error(f"❌ Could not load sample input for download: {e}")
 
+    with st.sidebar.expander("⚙️ Performance", expanded=False):
+        lookup_workers = st.number_input(
+            "Parallel company lookups", min_value=1, max_value=64,
+            value=DEFAULT_LOOKUP_WORKERS, key="lookup_workers"
+        )
+        analysis_workers = st.number_input(
+            "Parallel website analyses", min_value=1, max_value=32,
+            value=DEFAULT_ANALYSIS_WORKERS, key="analysis_workers"
+        )
+        batch_analysis = st.checkbox(
+            "Batch Gemini requests", value=False, key="batch_analysis",
+            help="Analyze several companies per Gemini call to cut request count and rate-limit pressure"
+        )
+        about_page = st.checkbox(
+            "Also read the About page", value=content_select.DEFAULT_ABOUT_PAGE, key="about_page",
+            help="Add the most relevant About-page text to each company's Gemini prompt (one extra request per site)"
+        )
+        cache_mode = st.selectbox(
+            "Lookup cache", cache.CACHE_MODES, index=0, key="cache_mode",
+            help="use: reuse earlier results, refresh: re-fetch and overwrite, bypass: ignore the cache"
+        )
+    # Applied to the job this session starts, not to the whole process.
+    settings = {
+        "lookup_workers": lookup_workers,
+        "analysis_workers": analysis_workers,
+        "batch_token_budget": DEFAULT_BATCH_TOKEN_BUDGET if batch_analysis else None,
+        "cache_mode": cache_mode,
+        "about_page": about_page,
+    }
+
     st.sidebar.markdown("---")
     st.sidebar.markdown(
         """
@@ -188,47 +174,29 @@ def main():
             st.error("❌ CSV must contain a column named `company_name`.")
             return
 
-        if 'last_uploaded' not in st.session_state or st.session_state.last_uploaded != input_method:
-            st.session_state.enriched_df = None
-            st.session_state.last_uploaded = input_method
-
-        if 'enriched_df' not in st.session_state:
-            st.session_state.enriched_df = None
+        # The job for this input lives in this session's state across reruns.
+        key = export.fingerprint(df)
+        job = session_jobs().get(key)
 
-        if st.session_state.enriched_df is None:
+        if job is None:
             if st.button("🚀 Run Enrichment"):
-                with st.spinner("Processing... This may take a few minutes."):
-                    try:
-                        st.session_state.enriched_df = enrich_companies(df)
-                        st.success("✅ Enrichment complete!")
-                    except Exception as e:
-                        st.error(f"❌ An error occurred during enrichment: {e}")
-                        return
-        else:
-            st.info("✅ Enrichment already completed. Upload a new file or change source to re-run.")
-
-        if st.session_state.enriched_df is not None:
-            st.subheader("📊 Enrichment Results")
-            st.dataframe(st.session_state.enriched_df)
-
-            st.markdown("---")
-
-            csv_data = dataframe_to_csv_download(st.session_state.enriched_df)
-            excel_data = dataframe_to_excel_download(st.session_state.enriched_df)
-
-            st.download_button(
-                label="⬇️ Download enriched CSV",
-                data=csv_data,
-                file_name="enriched_companies.csv",
-                mime="text/csv"
-            )
-
-            st.download_button(
-                label="⬇️ Download enriched Excel (.xlsx)",
-                data=excel_data,
-                file_name="enriched_companies.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+                start_job(key, df, settings)
+                st.rerun()
+
+        if job is not None:
+            if job.running:
+                show_running_job(job)
+            else:
+                if job.error is not None:
+                    st.error(f"❌ An error occurred during enrichment: {job.error}")
+                elif job.done < job.total:
+                    st.warning(f"⏹️ Enrichment stopped after {job.done} of {job.total} companies.")
+                else:
+                    st.success("✅ Enrichment complete! Upload a new file or change source to re-run.")
+                if job.done < job.total and st.button("🔁 Run Enrichment again"):
+                    start_job(key, df, settings)
+                    st.rerun()
+                show_results(job)
 
 if __name__ == "__main__":
     main()
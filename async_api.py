@@ -0,0 +1,584 @@
+"""Asyncio-native enrichment for embedding in async services.
+
+``await enrich(company)`` returns one enriched row and ``enrich_many(rows)``
+is an async iterator of ``(row, result)`` pairs, so a single event loop can
+keep hundreds of lookups in flight. HTTP goes through an httpx.AsyncClient,
+JavaScript-only sites through the browser pool's async Playwright and Gemini
+through ``generate_content_async``; quotas, the SQLite cache and metrics are
+shared with the threaded pipeline. Google search (``googlesearch`` has no
+async API) and HTML parsing run in worker threads.
+
+Every call has a timeout and can be cancelled; work shared by concurrent
+callers (the same company, site or page text) is cancelled once its last
+caller is gone.
+"""
+import asyncio
+import logging
+import random
+import weakref
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - only needed for the async API
+    httpx = None
+
+import browser_pool
+import content_select
+import dedup
+import fetch_router
+import llm3
+import metrics
+import parse_pool
+import rate_limiter
+import scraper3
+import wiki_bulk
+from cache import MISS
+from enrichment import METADATA_FIELDS, NA_ANALYSIS, build_result, empty_details, needs_lookup
+from http_client import MAX_BACKOFF, MAX_RESPONSE_BYTES, RETRY_STATUSES, ResponseTooLarge, retry_after_seconds
+
+DEFAULT_CONCURRENCY = 100
+DEFAULT_TIMEOUT = 180          # seconds per company, lookup and analysis included
+HTTP_RETRIES = 3
+MAX_CONNECTIONS = 200
+WIKI_BATCH_WAIT = 0.05         # how long a Wikipedia title waits for others to share its bulk query
+MEMO_TTL = 60 * 60             # how long a finished result is reused for later duplicates
+USER_AGENT = 'Mozilla/5.0'
+
+
+class AsyncHttpClient:
+    """httpx.AsyncClient with the retries, size limit and per-host quotas of http_client.HttpClient."""
+
+    def __init__(self, retries=HTTP_RETRIES, backoff=1.0, max_bytes=MAX_RESPONSE_BYTES,
+                 max_connections=MAX_CONNECTIONS):
+        if httpx is None:
+            raise RuntimeError("The async API needs httpx (pip install httpx)")
+        self.retries = retries
+        self.backoff = backoff
+        self.max_bytes = max_bytes
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    def backoff_delay(self, attempt, response=None):
+        """Exponential backoff with full jitter, overridden by the server's Retry-After."""
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    async def get(self, url, params=None, headers=None, timeout=10, retries=None, max_bytes=None):
+        """GET ``url`` and return an ``httpx.Response`` whose body is already read.
+
+        Connection errors, timeouts and 429/5xx responses are retried; other
+        HTTP errors raise immediately. Bodies over ``max_bytes`` raise
+        ResponseTooLarge.
+        """
+        retries = retries or self.retries
+        service = rate_limiter.service_for_host(urlparse(url).netloc)
+        label = rate_limiter.service_label(service)
+        for attempt in range(retries):
+            response = None
+            try:
+                async with rate_limiter.async_slot(service) as limiter:
+                    with metrics.span('http_request', service=label):
+                        response = await self._get_once(url, params, headers, timeout, max_bytes or self.max_bytes)
+                if response.status_code == 429:
+                    limiter.throttled(retry_after_seconds(response))
+                elif response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    limiter.succeeded()
+                    return response
+                error = httpx.HTTPStatusError(f"{response.status_code} for url: {response.url}",
+                                              request=response.request, response=response)
+            except (ResponseTooLarge, httpx.HTTPStatusError):
+                raise
+            except httpx.HTTPError as e:
+                error = e
+
+            if attempt == retries - 1:
+                logging.error(f"Request failed after {retries} attempts: {error}")
+                raise error
+            delay = self.backoff_delay(attempt, response)
+            metrics.count('http_retries', service=label,
+                          reason=str(response.status_code) if response is not None else type(error).__name__)
+            logging.warning(f"Request failed ({error}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    async def _get_once(self, url, params, headers, timeout, max_bytes):
+        async with self._client.stream('GET', url, params=params, headers=headers, timeout=timeout) as response:
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ResponseTooLarge(f"{url} declares {declared} bytes (limit {max_bytes})")
+            body = bytearray()
+            async for chunk in response.aiter_bytes(64 * 1024):
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    raise ResponseTooLarge(f"{url} exceeded {max_bytes} bytes")
+            response._content = bytes(body)
+        return response
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class _Shared:
+    __slots__ = ('task', 'callers', 'settled_at')
+
+    def __init__(self, task):
+        self.task = task
+        self.callers = 0
+        self.settled_at = None
+
+
+class InFlight:
+    """One task per key shared by all its callers, like ``dedup.FutureMemo`` for the thread pools.
+
+    A task is cancelled when its last caller is cancelled. Finished
+    results for which ``keep(result)`` is true are reused by later
+    duplicates (even with the cache bypassed) for ``ttl`` seconds, up to
+    ``max_entries`` keys; other results, failures and cancellations are
+    forgotten, so a lookup that came back empty is retried by the next
+    caller. Hits are counted as ``dedup_hits{kind}``.
+    """
+
+    def __init__(self, kind, keep, ttl=MEMO_TTL, max_entries=dedup.DEFAULT_MEMO_SIZE):
+        self.kind = kind
+        self.keep = keep
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self._shared = OrderedDict()
+
+    async def run(self, key, factory):
+        shared = self._shared.get(key)
+        if shared is not None and shared.settled_at is not None and self._now() - shared.settled_at > self.ttl:
+            del self._shared[key]
+            shared = None
+        if shared is None:
+            shared = self._shared[key] = _Shared(asyncio.ensure_future(factory()))
+            shared.task.add_done_callback(lambda _: self._settled(key, shared))
+            if len(self._shared) > self.max_entries:
+                self._shared.popitem(last=False)
+        else:
+            self._shared.move_to_end(key)
+            self.hits += 1
+            metrics.count('dedup_hits', kind=self.kind)
+        shared.callers += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.callers -= 1
+            if not shared.callers and not shared.task.done():
+                shared.task.cancel()
+
+    def _settled(self, key, shared):
+        task = shared.task
+        if task.cancelled() or task.exception() is not None or not self.keep(task.result()):
+            if self._shared.get(key) is shared:
+                del self._shared[key]
+        else:
+            shared.settled_at = self._now()
+
+    @staticmethod
+    def _now():
+        return asyncio.get_running_loop().time()
+
+
+class WikiBatcher:
+    """Resolves Wikipedia titles in bulk: titles asked for within WIKI_BATCH_WAIT share one query."""
+
+    def __init__(self, http):
+        self.http = http
+        self._pending = {}
+        self._timer = None
+        self._queries = set()
+
+    def page(self, title):
+        """Future of the WikiPage for ``title``."""
+        future = self._pending.get(title)
+        if future is None:
+            future = self._pending[title] = asyncio.get_running_loop().create_future()
+        if len(self._pending) >= wiki_bulk.BATCH_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(WIKI_BATCH_WAIT, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._query(batch))
+            self._queries.add(task)
+            task.add_done_callback(self._queries.discard)
+
+    async def _query(self, batch):
+        titles = list(batch)
+        try:
+            metrics.count('wikipedia_titles', len(titles))
+            params = wiki_bulk.query_params(titles)
+            merged = wiki_bulk.new_merged()
+            while True:
+                response = await self.http.get(wiki_bulk.API_URL, params=params,
+                                               headers={'User-Agent': wiki_bulk.USER_AGENT},
+                                               timeout=30, max_bytes=wiki_bulk.MAX_RESPONSE_BYTES)
+                more = wiki_bulk.merge_query(merged, response.json())
+                if not more:
+                    break
+                params.update(more)
+            pages = wiki_bulk.resolve_batch(titles, merged)
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for title, future in batch.items():
+            if not future.done():
+                future.set_result(pages[title])
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for task in self._queries:
+            task.cancel()
+
+
+def _found_details(details):
+    return any(details[field] != 'N/A' for field in METADATA_FIELDS)
+
+
+def _complete_analysis(result):
+    return "N/A" not in result
+
+
+async def _parse(fn, data, *args, **kwargs):
+    """Run a CPU-bound parse function off the event loop (in parse_pool when it is enabled)."""
+    return await asyncio.to_thread(parse_pool.run, fn, data, *args, **kwargs)
+
+
+class AsyncEnricher:
+    """Async counterpart of EnrichmentEngine for use inside a running event loop.
+
+    At most ``concurrency`` companies are enriched at once and each call
+    gives up after ``timeout`` seconds. Use ``async with`` (or ``aclose``)
+    to release the HTTP connections.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, http=None):
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.http = http or AsyncHttpClient(max_connections=max(MAX_CONNECTIONS, self.concurrency))
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wiki = WikiBatcher(self.http)
+        self._companies = InFlight('company', _found_details)
+        self._sites = InFlight('site', _complete_analysis)
+        self._contents = InFlight('content', _complete_analysis)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        self._wiki.cancel()
+        await self.http.aclose()
+
+    # Stage 1: company metadata
+
+    async def company_details(self, company_name):
+        """Async ``scraper3.get_company_details``, sharing its cache layer."""
+        cached = scraper3.get_company_details.lookup(company_name)
+        if cached is not MISS:
+            return cached
+        with metrics.span('company_details'):
+            info = await self._company_details(company_name)
+        scraper3.get_company_details.store(info, company_name)
+        return info
+
+    async def _company_details(self, company_name):
+        info = empty_details(company_name)
+
+        wiki_page = await asyncio.shield(self._wiki.page(company_name))
+        if not wiki_page.exists:
+            logging.info(f"Wikipedia page not found for {company_name}, resolving its website")
+            website, source = await asyncio.to_thread(scraper3.resolve_website, company_name)
+            scraper3.record_fields(info, {'Website': website}, source)
+            return info
+
+        with metrics.span('parse', step='infobox_wikitext'):
+            fields, complete = await _parse(wiki_bulk.infobox_details, wiki_page.wikitext)
+        if complete:
+            scraper3.record_fields(info, {field: scraper3.fix_url(value) if field == 'Website'
+                                          else scraper3.clean_text(value)
+                                          for field, value in fields.items()}, scraper3.SOURCE_INFOBOX)
+        else:
+            metrics.count('fallbacks', kind='infobox_html')
+            try:
+                response = await self.http.get(wiki_page.fullurl, timeout=10)
+                with metrics.span('parse', step='infobox_html'):
+                    scraper3.record_fields(info, await _parse(scraper3.infobox_html_fields, response.content,
+                                                              response.encoding), scraper3.SOURCE_INFOBOX)
+            except Exception as e:
+                logging.warning(f"Error parsing infobox for {company_name}: {e}")
+
+        missing = [field for field in scraper3.TEXT_FIELD_KEYWORDS if info[field] == 'N/A']
+        if missing:
+            metrics.count('fallbacks', kind='wikipedia_text')
+            try:
+                with metrics.span('wikipedia_text'):
+                    page_text = await self._wikipedia_text(wiki_page.title)
+                with metrics.span('parse', step='wikipedia_text'):
+                    scraper3.record_fields(info, await _parse(scraper3.scan_page_text, page_text, missing),
+                                           scraper3.SOURCE_WIKI_TEXT)
+            except Exception as e:
+                logging.warning(f"Error reading Wikipedia text for {company_name}: {e}")
+
+        scraper3.learn_website(info, company_name, wiki_page.title)
+        if info['Website'] == 'N/A':
+            logging.info(f"No website on Wikipedia for {company_name}, resolving it")
+            website, source = await asyncio.to_thread(scraper3.resolve_website, company_name)
+            scraper3.record_fields(info, {'Website': website}, source)
+        return info
+
+    async def _wikipedia_text(self, title):
+        """Plain text of a whole article (what wikipediaapi's ``page.text`` returns)."""
+        params = {'action': 'query', 'format': 'json', 'formatversion': 2, 'redirects': 1,
+                  'prop': 'extracts', 'explaintext': 1, 'titles': title}
+        response = await self.http.get(wiki_bulk.API_URL, params=params,
+                                       headers={'User-Agent': wiki_bulk.USER_AGENT}, timeout=30)
+        pages = response.json().get('query', {}).get('pages', [])
+        return pages[0].get('extract', '') if pages else ''
+
+    async def _lookup(self, company):
+        try:
+            return await self.company_details(company)
+        except Exception as e:
+            logging.warning(f"Metadata lookup failed for {company}: {e}")
+            return empty_details(company)
+
+    # Stage 2: website text and Gemini analysis
+
+    async def website_text(self, url):
+        """Async ``llm3.extract_visible_text``, sharing its cache layer."""
+        cached = llm3.extract_visible_text.lookup(url)
+        if cached is not MISS:
+            return cached
+        with metrics.span('website_text'):
+            text = await self._website_text(url)
+        llm3.extract_visible_text.store(text, url)
+        return text
+
+    async def _website_text(self, url):
+        page = await self._page_blocks(url)
+        if not page or not page[0]:
+            return ""
+        blocks, dropped, about_href = page
+        about_blocks = ()
+        if content_select.about_page_enabled():
+            about = await self._blocks_requests(content_select.about_url(url, about_href))
+            if about:
+                about_blocks = about[0]
+                dropped += about[1]
+        text, repeated = content_select.select(blocks, about_blocks)
+        metrics.count('boilerplate_blocks', dropped + repeated)
+        metrics.distribution('content_tokens', llm3.estimate_tokens(text))
+        return text
+
+    async def _page_blocks(self, url):
+        fetchers = {'requests': self._fetch_requests}
+        if llm3.use_playwright():
+            fetchers['playwright'] = self._fetch_playwright
+        if llm3.SCRAPINGBEE_API_KEY:
+            fetchers['scrapingbee'] = self._fetch_scrapingbee
+        return await fetch_router.fetch_async(url, fetchers, self._parse_blocks)
+
+    async def _parse_blocks(self, html, encoding=None):
+        with metrics.span('parse', step='content_blocks'):
+            return await _parse(llm3.html_extract.text_blocks, html, encoding=encoding)
+
+    async def _blocks_requests(self, url):
+        try:
+            return await self._parse_blocks(*await self._fetch_requests(url))
+        except Exception as e:
+            logging.warning(f"Requests failed for {url}: {e}")
+            return None
+
+    async def _fetch_requests(self, url):
+        with metrics.span('fetch', method='requests'):
+            response = await self.http.get(url, timeout=10, headers={'User-Agent': USER_AGENT})
+        return response.content, response.encoding
+
+    async def _fetch_scrapingbee(self, url):
+        logging.info(f"Using ScrapingBee for {url}")
+        params = {"api_key": llm3.SCRAPINGBEE_API_KEY, "url": url, "render_js": "true"}
+        with metrics.span('fetch', method='scrapingbee'):
+            response = await self.http.get(llm3.SCRAPINGBEE_API_URL, params=params, timeout=30)
+        return response.content, response.encoding
+
+    async def _fetch_playwright(self, url):
+        with metrics.span('fetch', method='playwright'):
+            return await browser_pool.get_pool().render_async(url), None
+
+    async def generate(self, model, prompt):
+        """Async ``llm3.generate``: same quota, classified retries and usage metrics."""
+        for attempt in range(llm3.GEMINI_ATTEMPTS):
+            async with rate_limiter.async_slot('gemini') as limiter:
+                try:
+                    with metrics.span('gemini'):
+                        response = await model.generate_content_async(prompt)
+                    break
+                except Exception as e:
+                    error, reason = e, llm3.classify_error(e)
+                    if reason == 'rate_limit':
+                        limiter.throttled()
+                    if reason not in ('rate_limit', 'transient') or attempt == llm3.GEMINI_ATTEMPTS - 1:
+                        raise
+            await asyncio.sleep(llm3.retry_delay(attempt, reason, error))
+        limiter.succeeded()
+        llm3.record_usage(response, prompt)
+        return response
+
+    async def analyze_content(self, content, company_name):
+        """Async ``llm3.analyze_content``: a malformed reply is re-asked once, parsed fields are kept."""
+        prompt = llm3.build_analysis_prompt(company_name, content)
+        best = NA_ANALYSIS
+        try:
+            model = llm3.json_model(llm3.ANALYSIS_SCHEMA)
+            for attempt in range(llm3.MALFORMED_REASKS + 1):
+                response = await self.generate(model, prompt if attempt == 0 else prompt + llm3.REASK_NOTE)
+                result = llm3.parse_analysis(response)
+                if "N/A" not in result:
+                    return result
+                best = max(best, result, key=llm3.completeness)
+                if attempt < llm3.MALFORMED_REASKS:
+                    metrics.count('gemini_retries', reason='malformed')
+            logging.warning(f"Failed to parse JSON from model response for {company_name}")
+            metrics.count('gemini_failures', reason='malformed')
+            return best
+        except Exception as e:
+            logging.warning(f"Gemini API error for {company_name}: {e}")
+            metrics.count('gemini_failures', reason=llm3.classify_error(e))
+            return best
+
+    async def analyze_site(self, details):
+        """Website text + Gemini analysis, with one Gemini call per distinct page text."""
+        url, company = details['Website'], details['Company Name']
+        try:
+            cached = llm3.analyze_company_website.lookup(url, company)
+            if cached is not MISS:
+                return cached
+            content = await self.website_text(url)
+            if not content:
+                return NA_ANALYSIS
+            result = await self._contents.run(dedup.content_hash(content),
+                                              lambda: self.analyze_content(content, company))
+            llm3.analyze_company_website.store(result, url, company)
+            return result
+        except Exception as e:
+            logging.warning(f"Website analysis failed for {company}: {e}")
+            return NA_ANALYSIS
+
+    # Public API
+
+    async def _enrich(self, row):
+        company = row['company_name']
+        if needs_lookup(row):
+            details = dict(await self._companies.run(dedup.normalize_company(company),
+                                                     lambda: self._lookup(company)))
+        else:
+            details = {field: row[field] for field in METADATA_FIELDS}
+        details['Company Name'] = company
+        if details['Website'] == 'N/A':
+            return build_result(details, NA_ANALYSIS)
+        analysis = await self._sites.run(dedup.normalize_url(details['Website']),
+                                         lambda: self.analyze_site(details))
+        return build_result(details, analysis)
+
+    async def enrich(self, company, timeout=None):
+        """Result (OUTPUT_COLUMNS -> value) for a company name, or a row dict with a 'company_name'
+        and any metadata it already has. Raises TimeoutError after ``timeout`` seconds."""
+        row = {'company_name': company} if isinstance(company, str) else company
+        async with self._slots:
+            try:
+                result = await asyncio.wait_for(self._enrich(row), self.timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                metrics.count('timeouts')
+                raise
+        metrics.count('rows')
+        return result
+
+    async def _enrich_or_na(self, row, timeout):
+        try:
+            return row, await self.enrich(row, timeout)
+        except Exception as e:
+            company = row if isinstance(row, str) else row['company_name']
+            logging.warning(f"Enrichment failed for {company}: {e!r}")
+            return row, build_result(empty_details(company), NA_ANALYSIS)
+
+    async def enrich_many(self, rows, timeout=None, ordered=False):
+        """Yield ``(row, result)`` for each company name or row of ``rows`` (an iterable or async iterable).
+
+        Rows are read lazily, with at most ``concurrency`` in flight; results
+        come as they finish, or in input order with ``ordered=True``. A row
+        that fails or times out yields "N/A" values. Closing the iterator
+        cancels the rows still in flight.
+        """
+        tasks = deque()
+
+        async def next_result():
+            if ordered:
+                return await tasks.popleft()
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            task = next(t for t in tasks if t in done)
+            tasks.remove(task)
+            return task.result()
+
+        try:
+            async for row in _aiter(rows):
+                tasks.append(asyncio.ensure_future(self._enrich_or_na(row, timeout)))
+                while len(tasks) >= self.concurrency:
+                    yield await next_result()
+            while tasks:
+                yield await next_result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _aiter(rows):
+    if hasattr(rows, '__aiter__'):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+_enrichers = weakref.WeakKeyDictionary()
+
+
+def default_enricher():
+    """The AsyncEnricher shared by ``enrich``/``enrich_many`` calls on the running event loop."""
+    loop = asyncio.get_running_loop()
+    enricher = _enrichers.get(loop)
+    if enricher is None:
+        enricher = _enrichers[loop] = AsyncEnricher()
+    return enricher
+
+
+async def enrich(company, timeout=None):
+    return await default_enricher().enrich(company, timeout)
+
+
+async def enrich_many(rows, timeout=None, ordered=False):
+    async for pair in default_enricher().enrich_many(rows, timeout, ordered):
+        yield pair
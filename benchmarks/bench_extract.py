@@ -0,0 +1,99 @@
+"""Compare html_extract against the original BeautifulSoup html.parser path on saved pages.
+
+    python benchmarks/bench_extract.py [--repeat N]
+
+Checks that both paths produce the same text / infobox rows and prints the
+mean time per page for each. Also checks that ``fetch_router.is_js_shell``
+flags exactly the fixtures named ``*shell*``.
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import fetch_router  # noqa: E402
+import html_extract  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def legacy_visible_text(html):
+    soup = BeautifulSoup(html, "html.parser")
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return ' '.join(soup.stripped_strings)[:6000]
+
+
+def legacy_infobox_rows(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    infobox = soup.find('table', {'class': 'infobox'})
+    rows = []
+    if infobox:
+        for row in infobox.find_all('tr'):
+            header = row.find('th')
+            data = row.find('td')
+            if not header or not data:
+                continue
+            link = data.find('a')
+            rows.append((header.text, data.text, link['href'] if link and link.has_attr('href') else None))
+    return rows
+
+
+def timed(fn, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(html)
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    backends = ['html.parser'] + (['lxml'] if html_extract.etree is not None else [])
+    print(f"{'fixture':<26}{'task':<10}{'legacy ms':>11}" + ''.join(f"{b + ' ms':>16}" for b in backends)
+          + f"{'speedup':>10}  same")
+    mismatches = 0
+    for name in sorted(os.listdir(FIXTURES)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+            html = f.read()
+
+        expected, legacy_ms = timed(legacy_visible_text, html, args.repeat)
+        timings, same = [], True
+        for backend in backends:
+            text, ms = timed(lambda h: html_extract.visible_text(h, backend=backend), html, args.repeat)
+            timings.append(ms)
+            same = same and text == expected
+        mismatches += not same
+        print(f"{name:<26}{'text':<10}{legacy_ms:>11.2f}" + ''.join(f"{ms:>16.2f}" for ms in timings)
+              + f"{legacy_ms / min(timings):>9.1f}x  {'yes' if same else 'NO'}")
+
+        expected, legacy_ms = timed(legacy_infobox_rows, html, args.repeat)
+        if expected:
+            rows, ms = timed(lambda h: list(html_extract.infobox_rows(h)), html, args.repeat)
+            same = rows == expected
+            mismatches += not same
+            # infobox_rows always uses the best available backend; show it in that column.
+            cells = [f"{ms:>16.2f}" if b == html_extract.BACKEND else ' ' * 16 for b in backends]
+            print(f"{name:<26}{'infobox':<10}{legacy_ms:>11.2f}" + ''.join(cells)
+                  + f"{legacy_ms / ms:>9.1f}x  {'yes' if same else 'NO'}")
+
+        shell = fetch_router.is_js_shell(html)
+        if shell != ('shell' in name):
+            mismatches += 1
+            print(f"{name:<26}{'shell':<10}is_js_shell() is {shell}")
+
+    if mismatches:
+        sys.exit(f"{mismatches} result(s) differ from the legacy path or the shell check")
+
+
+if __name__ == '__main__':
+    main()
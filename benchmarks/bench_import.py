@@ -0,0 +1,102 @@
+"""Measure cold import time of the entry points and check heavy dependencies stay lazy.
+
+    python benchmarks/bench_import.py [--repeat N] [--max-ms MS] [--top N] [module ...]
+
+Each import runs in a fresh interpreter without GEMINI_API_KEY, so the
+numbers are what ``python main4.py --help`` or a Streamlit rerun pays before
+doing any work. Prints the median wall time per module, the slowest
+modules from ``-X importtime``, and exits non-zero if a module pulls in a
+dependency that should only load on first use, or is slower than
+``--max-ms``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that must not be loaded by importing each entry point.
+LAZY = ('google.generativeai', 'google.api_core', 'googlesearch', 'wikipediaapi', 'bs4', 'openpyxl')
+TARGETS = {
+    'main4': LAZY + ('pandas',),
+    'llm3': LAZY + ('pandas',),
+    'enrichment': LAZY + ('pandas',),
+    'async_api': LAZY + ('pandas',),
+    'app': LAZY,  # Streamlit needs pandas anyway
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(__import__('json').dumps({{'ms': elapsed * 1000, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def child_env():
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    env.pop('GEMINI_API_KEY', None)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def import_once(module, lazy):
+    out = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy=lazy)],
+                         cwd=ROOT, env=child_env(), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    """(cumulative ms, name) of the ``top`` slowest modules imported directly by ``module``."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd=ROOT, env=child_env(), capture_output=True, text=True, check=True)
+    # importtime lists a module's imports before it, indented one level (two spaces) deeper.
+    children = []
+    for line in out.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # header line
+        _, cumulative, name = fields
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == module:
+                return sorted(children, reverse=True)[:top]
+            children = []
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('modules', nargs='*', default=list(TARGETS), help='Entry points to import')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, help='Fail if a median import time exceeds this')
+    parser.add_argument('--top', type=int, default=5, help='Slowest imported packages to list per module')
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        lazy = TARGETS.get(module, LAZY)
+        import_once(module, lazy)  # warm the bytecode cache
+        runs = [import_once(module, lazy) for _ in range(args.repeat)]
+        median = statistics.median(run['ms'] for run in runs)
+        loaded = sorted({name for run in runs for name in run['loaded']})
+        print(f"{module:<12}{median:>9.0f} ms median over {args.repeat}"
+              + (f"   eagerly loaded: {', '.join(loaded)}" if loaded else ''))
+        for ms, name in slowest_imports(module, args.top):
+            print(f"{'':<14}{ms:>7.0f} ms  {name}")
+        if loaded:
+            failures.append(f"{module} imports {', '.join(loaded)} at startup")
+        if args.max_ms is not None and median > args.max_ms:
+            failures.append(f"{module} took {median:.0f} ms to import (budget {args.max_ms:.0f} ms)")
+    if failures:
+        sys.exit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,531 @@
+"""Run the enrichment pipeline offline against local stand-ins for every upstream service.
+
+    python benchmarks/bench_pipeline.py [--rows N] [--http-latency MS] [--error-rate P] ...
+
+Wikipedia, company websites (plain and JavaScript-only) and ScrapingBee are
+served by local HTTP servers with configurable latency, error rate and 429
+behaviour; Gemini and Google Search are replaced by in-process fakes. The
+real EnrichmentEngine -> get_company_details -> website analysis path runs
+over a synthetic lead list, and the run is reported as rows/sec, p50/p99
+latency per stage and peak RSS. No network access or API keys are needed.
+
+All synthetic websites share one local host, so its quota (``--site-rps``)
+stands in for the per-host limits summed over many real sites. Service
+quotas default to what the stand-ins can take rather than the production
+limits; pass ``--rate-limit gemini=1`` etc. to reproduce those.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import dedup  # noqa: E402
+
+WORDS = ['Nor', 'vex', 'Tal', 'ora', 'Quin', 'tix', 'Bel', 'mar', 'Zen', 'dra', 'Cor', 'lyn', 'Ves', 'pra']
+KINDS = ['Labs', 'Systems', 'Foods', 'Logistics', 'Health', 'Energy', 'Robotics', 'Media']
+INDUSTRIES = ['Software', 'Retail', 'Logistics', 'Healthcare', 'Energy', 'Financial services']
+CITIES = [('Chennai', 'India'), ('Austin, Texas', 'United States'), ('Berlin', 'Germany'), ('Toronto', 'Canada')]
+
+# Quotas used unless overridden with --rate-limit: high enough that the pipeline, not the stand-ins, is measured.
+BENCH_LIMITS = {
+    'wikipedia': {'rate': 500.0, 'burst': 100, 'concurrency': 32},
+    'google': {'rate': 100.0, 'burst': 10, 'concurrency': 4},
+    'scrapingbee': {'rate': 200.0, 'burst': 50, 'concurrency': 16},
+    'gemini': {'rate': 200.0, 'burst': 50, 'concurrency': 32},
+}
+
+
+class Faults:
+    """Latency and failure injection shared by a stand-in server or fake client."""
+
+    def __init__(self, latency_ms, error_rate, throttle_rate, retry_after):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    async def delay_async(self):
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def outcome(self):
+        """'throttle', 'error' or None for one request."""
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 'throttle'
+        if roll < self.throttle_rate + self.error_rate:
+            return 'error'
+        return None
+
+
+def company_name(i, rng):
+    return f"{rng.choice(WORDS)}{rng.choice(WORDS).lower()} {rng.choice(KINDS)} {i}"
+
+
+def lead_rows(count, duplicates, seed):
+    """Yield synthetic input rows; a ``duplicates`` share repeat an earlier company under a variant name."""
+    rng = random.Random(seed)
+    seen = []
+    for i in range(count):
+        if seen and rng.random() < duplicates:
+            name = rng.choice(seen)
+            name = rng.choice([name.upper(), name + ' Inc.', name.lower(), name + ', Ltd'])
+        else:
+            name = company_name(i, rng)
+            if len(seen) < 10000:
+                seen.append(name)
+        yield {'company_name': name}
+
+
+def company_key(name):
+    """The synthetic company a name variant ("Acme 3 Inc.", "ACME 3") stands for."""
+    return ' '.join(dedup.brand_words(name))
+
+
+def slug(name):
+    return company_key(name).replace(' ', '-')
+
+
+def fraction(key, salt):
+    """Deterministic value in [0, 1) per company, so every stand-in agrees on a company's traits."""
+    return zlib.crc32(f"{salt}:{key}".encode('utf-8')) % 10000 / 10000
+
+
+class World:
+    """What the stand-ins know about each synthetic company, derived from its name."""
+
+    def __init__(self, missing, html_infobox, js_sites, page_kb):
+        self.missing = missing
+        self.html_infobox = html_infobox
+        self.js_sites = js_sites
+        # Inline bundle in each page's <head>, like the framework code real sites ship.
+        self.bundle = '<script>' + 'window.__d.push({a:1,b:"x"});' * (page_kb * 1024 // 28) + '</script>'
+        self.urls = {}
+
+    def exists(self, title):
+        return fraction(company_key(title), 'missing') >= self.missing
+
+    def facts(self, title):
+        key = company_key(title)
+        rng = random.Random(key)
+        city, country = rng.choice(CITIES)
+        base = self.urls['js'] if fraction(key, 'js') < self.js_sites else self.urls['site']
+        return {
+            'industry': rng.choice(INDUSTRIES),
+            'city': city,
+            'country': country,
+            'employees': f"{rng.randint(10, 90000):,}",
+            'website': f"{base}/site/{slug(title)}",
+            'templated': fraction(key, 'html') < self.html_infobox,
+        }
+
+    def wikitext(self, title):
+        f = self.facts(title)
+        industry = f"{{{{Unbulleted list|[[{f['industry']}]]|Consulting}}}}" if f['templated'] else f"[[{f['industry']}]]"
+        return (f"{{{{Infobox company\n| name = {title}\n| industry = {industry}\n"
+                f"| hq_location_city = [[{f['city']}]]\n| hq_location_country = {f['country']}\n"
+                f"| num_employees = {f['employees']}\n| num_employees_year = 2024\n"
+                f"| website = {{{{URL|{f['website']}}}}}\n}}}}\n'''{title}''' is a company.")
+
+    def article(self, title):
+        f = self.facts(title)
+        industry = f"{f['industry']}<br>Consulting" if f['templated'] else f['industry']
+        return (f"<html><body><h1>{title}</h1><table class=\"infobox vcard\"><tbody>"
+                f"<tr><th>Industry</th><td>{industry}</td></tr>"
+                f"<tr><th>Headquarters</th><td>{f['city']}, {f['country']}</td></tr>"
+                f"<tr><th>Number of employees</th><td>{f['employees']} (2024)</td></tr>"
+                f"<tr><th>Website</th><td><a href=\"{f['website']}\">{f['website']}</a></td></tr>"
+                f"</tbody></table><p>{title} is a company.</p></body></html>")
+
+    def site(self, name, rendered=True):
+        if not rendered:
+            return "<html><head><script src=\"/app.js\"></script></head><body><div id=\"root\"></div></body></html>"
+        words = name.replace('-', ' ').title()
+        paragraphs = ''.join(f"<p>{words} helps teams ship faster with section {i} of our platform.</p>"
+                             for i in range(40))
+        return (f"<html><head><title>{words}</title><style>p{{margin:0}}</style>{self.bundle}</head><body>"
+                f"<nav><a href=\"/\">Home</a><a href=\"/site/{name}/about\">About</a></nav><h1>{words}</h1>"
+                f"{paragraphs}<footer>&copy; {words}. All rights reserved.</footer>"
+                f"<script>track()</script></body></html>")
+
+    def about(self, name):
+        words = name.replace('-', ' ').title()
+        return (f"<html><head><title>About {words}</title></head><body>"
+                f"<nav><a href=\"/\">Home</a><a href=\"/site/{name}/about\">About</a></nav><h1>About us</h1>"
+                f"<p>{words} was founded to help retail and logistics teams automate their operations.</p>"
+                f"<footer>&copy; {words}. All rights reserved.</footer></body></html>")
+
+
+def make_handler(world, role, faults):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body, content_type='text/html; charset=utf-8', headers=()):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            faults.delay()
+            outcome = faults.outcome()
+            if outcome == 'throttle':
+                return self.send(429, 'slow down', headers=[('Retry-After', str(faults.retry_after))])
+            if outcome == 'error':
+                return self.send(503, 'unavailable')
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if role == 'wikipedia' and url.path == '/w/api.php':
+                return self.send(200, json.dumps(self.query(query['titles'][0].split('|'))), 'application/json')
+            if role == 'wikipedia' and url.path.startswith('/wiki/'):
+                return self.send(200, world.article(unquote(url.path[6:]).replace('_', ' ')))
+            if role == 'site' and url.path.startswith('/site/') and url.path.endswith('/about'):
+                return self.send(200, world.about(url.path[6:-6]))
+            if role in ('site', 'js') and url.path.startswith('/site/'):
+                return self.send(200, world.site(url.path[6:], rendered=role == 'site'))
+            if role == 'scrapingbee':
+                return self.send(200, world.site(urlparse(query['url'][0]).path[6:]))
+            self.send(404, 'not found')
+
+        def query(self, titles):
+            pages = []
+            for title in titles:
+                if not world.exists(title):
+                    pages.append({'title': title, 'missing': True})
+                    continue
+                pages.append({
+                    'title': title,
+                    'fullurl': f"{world.urls['wikipedia']}/wiki/{quote(title.replace(' ', '_'))}",
+                    'revisions': [{'slots': {'main': {'content': world.wikitext(title)}}}],
+                })
+            return {'batchcomplete': True, 'query': {'pages': pages}}
+
+    return Handler
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def make_fake_model(faults, google_exceptions, malformed_rate=0.0):
+    """Stand-in for genai.GenerativeModel that answers single and batched analysis prompts.
+
+    ``malformed_rate`` of the answers are cut off mid-JSON, as a reply that hit its token limit.
+    """
+
+    class FakeModel:
+        def __init__(self, model_name, **kwargs):
+            self.model_name = model_name
+
+        def generate_content(self, prompt, **kwargs):
+            faults.delay()
+            return self.respond(prompt)
+
+        async def generate_content_async(self, prompt, **kwargs):
+            await faults.delay_async()
+            return self.respond(prompt)
+
+        def respond(self, prompt):
+            outcome = faults.outcome()
+            if outcome == 'throttle':
+                raise google_exceptions.ResourceExhausted('429 Quota exceeded (offline benchmark)')
+            if outcome == 'error':
+                raise google_exceptions.InternalServerError('500 Internal error (offline benchmark)')
+            entries = re.findall(r'### id: (\d+)\nCompany Name: "(.*)"', prompt)
+            if entries:
+                text = json.dumps([dict(self.answer(name), id=int(i), company_name=name) for i, name in entries])
+            else:
+                name = re.search(r'Company Name: "(.*)"', prompt).group(1)
+                text = json.dumps(self.answer(name))
+            if random.random() < malformed_rate:
+                text = text[:len(text) * 2 // 3]
+            return FakeResponse(text)
+
+        def answer(self, name):
+            return {
+                'summary': f"{name} builds software for operations teams.",
+                'target_customer': 'Mid-sized companies',
+                'ai_automation_idea': f"Automate {name}'s customer onboarding.",
+            }
+
+    return FakeModel
+
+
+def fake_search(world):
+    def search(query, num_results=10, **kwargs):
+        name = query.replace(' official website', '')
+        return [f"{world.urls['site']}/site/{slug(name)}"]
+    return search
+
+
+class StageTimer:
+    """Collects wall-clock durations per pipeline stage."""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        timed.__dict__.update(fn.__dict__)  # keep cached() helpers such as .lookup / .store
+        return timed
+
+    def wrap_async(self, stage, fn):
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        report = {}
+        for stage, values in self.samples.items():
+            values = sorted(values)
+            report[stage] = {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1),
+            }
+        return report
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    """Peak RSS of this process (parse worker processes are not included)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def parse_args():
+    import entity_store
+    import rate_limiter
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000, help='Synthetic input rows (e.g. 10 to 100000)')
+    parser.add_argument('--duplicates', type=float, default=0.1, help='Share of rows repeating an earlier company')
+    parser.add_argument('--missing', type=float, default=0.05, help='Share of companies without a Wikipedia page')
+    parser.add_argument('--html-infobox', type=float, default=0.1,
+                        help='Share of infoboxes that need the article HTML instead of wikitext')
+    parser.add_argument('--js-sites', type=float, default=0.02, help='Share of websites that need JS rendering')
+    parser.add_argument('--page-kb', type=int, default=100, help='Approximate size of each website page')
+    parser.add_argument('--http-latency', type=float, default=20, help='Mean stand-in HTTP latency (ms)')
+    parser.add_argument('--gemini-latency', type=float, default=300, help='Mean fake Gemini latency (ms)')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='Share of requests failing with 5xx')
+    parser.add_argument('--throttle-rate', type=float, default=0.01, help='Share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=0.2,
+                        help='Retry-After seconds sent with 429s (also the Gemini retry backoff base)')
+    parser.add_argument('--malformed-rate', type=float, default=0.01,
+                        help='Share of Gemini answers truncated mid-JSON')
+    parser.add_argument('--site-rps', type=float, default=500, help='Quota for the shared synthetic website host')
+    parser.add_argument('--lookup-workers', type=int, default=8)
+    parser.add_argument('--analysis-workers', type=int, default=4)
+    parser.add_argument('--parse-workers', type=int, default=0, help='HTML parsing processes; 0 = parse in-thread')
+    parser.add_argument('--batch-tokens', type=int, default=0, help='Batched Gemini budget; 0 = one call per company')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Run through the asyncio API (async_api.AsyncEnricher) instead of EnrichmentEngine')
+    parser.add_argument('--async-concurrency', type=int, default=100, help='Companies in flight with --async')
+    parser.add_argument('--content-tokens', type=int, help='Website-text token budget per company (as in main4.py)')
+    parser.add_argument('--about-page', action='store_true', help="Also fetch each site's About page")
+    parser.add_argument('--cache', choices=('bypass', 'use', 'refresh'), default='bypass',
+                        help='Cache mode; the cache lives in a temporary directory unless --cache-path is given')
+    parser.add_argument('--cache-path')
+    parser.add_argument('--store', metavar='PATH',
+                        help='Entity store (as in main4.py); run twice with the same PATH to time an incremental '
+                             'refresh')
+    parser.add_argument('--max-age', action='append', default=[], metavar='FIELD=DAYS',
+                        type=entity_store.parse_max_age, help='Field freshness override for --store, as in main4.py')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='SERVICE=RPS[:CONCURRENCY]',
+                        type=rate_limiter.parse_limit, help='Override a stand-in quota, as in main4.py')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Also write the report to this file')
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own log output")
+    return parser.parse_args()
+
+
+def main():
+    # Checked by llm3 on the first Gemini call; the fake model never uses it.
+    os.environ.setdefault('GEMINI_API_KEY', 'offline-benchmark')
+    # Read by llm3 at import; the ScrapingBee stand-in ignores it.
+    os.environ.setdefault('SCRAPINGBEE_API_KEY', 'offline-benchmark')
+    args = parse_args()
+    if args.store and args.use_async:
+        sys.exit('--store is not supported with --async')
+    random.seed(args.seed)
+
+    http_faults = Faults(args.http_latency, args.error_rate, args.throttle_rate, args.retry_after)
+    world = World(args.missing, args.html_infobox, args.js_sites, args.page_kb)
+    servers = {role: start_server(make_handler(world, role, http_faults))
+               for role in ('wikipedia', 'site', 'js', 'scrapingbee')}
+    for role, server in servers.items():
+        world.urls[role] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ['WIKIPEDIA_API_URL'] = world.urls['wikipedia'] + '/w/api.php'
+    os.environ['SCRAPINGBEE_API_URL'] = world.urls['scrapingbee'] + '/api/v1/'
+
+    import cache
+    import content_select
+    import domain_index
+    import enrichment
+    import entity_store
+    import fetch_router
+    import llm3
+    import metrics
+    import parse_pool
+    import rate_limiter
+    import scraper3
+    from google.api_core import exceptions as google_exceptions
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    for role in ('wikipedia', 'scrapingbee'):
+        rate_limiter.HOST_SERVICES[urlparse(world.urls[role]).netloc] = role
+    limits = dict(BENCH_LIMITS)
+    for role in ('site', 'js'):
+        limits[urlparse(world.urls[role]).netloc] = {'rate': args.site_rps, 'burst': 50, 'concurrency': 64}
+    limits.update(dict(args.rate_limit))
+    rate_limiter.configure(limits)
+
+    tmpdir = tempfile.TemporaryDirectory()
+    parse_pool.configure(args.parse_workers)
+    content_select.configure(token_budget=args.content_tokens, about_page=args.about_page)
+    cache.configure(path=args.cache_path or os.path.join(tmpdir.name, 'cache.sqlite3'), mode=args.cache)
+    # No browser offline: JS shells escalate from plain requests to the ScrapingBee stand-in.
+    fetch_router.configure(path=os.path.join(tmpdir.name, 'routes.sqlite3'), tiers=('requests', 'scrapingbee'))
+
+    gemini_faults = Faults(args.gemini_latency, args.error_rate, args.throttle_rate, args.retry_after)
+    llm3.gemini().GenerativeModel = make_fake_model(gemini_faults, google_exceptions, args.malformed_rate)
+    llm3.GEMINI_BACKOFF = args.retry_after
+    scraper3.search = fake_search(world)
+    # Offline there's no DNS for guessed domains, and every stand-in site lives on
+    # 127.0.0.1, so search results are matched on their path instead of the domain.
+    domain_index.configure(path=os.path.join(tmpdir.name, 'domains.sqlite3'), guess=False)
+    domain_index.matches_name = lambda name, url: url.endswith('/site/' + slug(name))
+
+    timer = StageTimer()
+    enrichment.get_company_details = timer.wrap('lookup', enrichment.get_company_details)
+    enrichment.extract_visible_text = timer.wrap('fetch', enrichment.extract_visible_text)
+    llm3.generate = timer.wrap('gemini', llm3.generate)
+
+    started = {}
+
+    def rows():
+        for i, row in enumerate(lead_rows(args.rows, args.duplicates, args.seed)):
+            row['_id'] = i
+            started[i] = time.perf_counter()
+            yield row
+
+    filled = {'Website': 0, 'Summary': 0}
+    done = 0
+
+    def finished(row, result):
+        nonlocal done
+        timer.record('row', time.perf_counter() - started.pop(row['_id']))
+        for field in filled:
+            filled[field] += result[field] != 'N/A'
+        done += 1
+
+    async def enrich_async():
+        import async_api
+        async with async_api.AsyncEnricher(concurrency=args.async_concurrency) as enricher:
+            enricher.company_details = timer.wrap_async('lookup', enricher.company_details)
+            enricher.website_text = timer.wrap_async('fetch', enricher.website_text)
+            enricher.generate = timer.wrap_async('gemini', enricher.generate)
+            async for row, result in enricher.enrich_many(rows()):
+                finished(row, result)
+
+    start = time.perf_counter()
+    if args.use_async:
+        asyncio.run(enrich_async())
+    else:
+        store = entity_store.EntityStore(args.store, dict(args.max_age)) if args.store else None
+        engine = enrichment.EnrichmentEngine(args.lookup_workers, args.analysis_workers,
+                                             batch_token_budget=args.batch_tokens or None, store=store)
+        for row, result in engine.enrich(rows()):
+            finished(row, result)
+        if store is not None:
+            store.close()
+    elapsed = time.perf_counter() - start
+
+    for server in servers.values():
+        server.shutdown()
+    tmpdir.cleanup()
+
+    report = {
+        'rows': done,
+        'seconds': round(elapsed, 2),
+        'rows_per_sec': round(done / elapsed, 2) if elapsed else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'filled': {field: round(count / done, 3) if done else 0 for field, count in filled.items()},
+        'stages': timer.summary(),
+        'throttles': {name: s['throttles'] for name, s in rate_limiter.stats().items() if s['throttles']},
+        'metrics': metrics.report(),
+    }
+
+    print(f"{done} rows in {elapsed:.1f}s: {report['rows_per_sec']} rows/s, peak RSS {report['peak_rss_mb']} MB")
+    print(f"{'stage':<10}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage in ('lookup', 'fetch', 'gemini', 'row'):
+        s = report['stages'].get(stage)
+        if s:
+            print(f"{stage:<10}{s['count']:>8}{s['p50_ms']:>10}{s['p99_ms']:>10}{s['max_ms']:>10}")
+    print(f"filled: {report['filled']}  throttles: {report['throttles']}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
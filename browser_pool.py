@@ -0,0 +1,197 @@
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/115.0 Safari/537.36")
+
+DEFAULT_MAX_PAGES = int(os.getenv("BROWSER_POOL_PAGES", "4"))
+DEFAULT_MAX_USES = 25
+NAVIGATION_TIMEOUT = 60
+READY_TIMEOUT = 15
+NETWORK_IDLE_TIMEOUT = 5
+STABLE_POLL_INTERVAL = 0.5
+
+
+class BrowserPool:
+    """One long-lived headless Chromium shared by all threads.
+
+    Playwright runs on a private asyncio loop in a background thread; callers
+    lease a context + page for each render through the thread-safe ``render``.
+    Contexts are recycled after ``max_uses`` renders, and the browser is
+    relaunched if it crashes or disconnects.
+    """
+
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES, max_uses=DEFAULT_MAX_USES,
+                 ready_timeout=READY_TIMEOUT, network_idle_timeout=NETWORK_IDLE_TIMEOUT):
+        self.max_pages = max(1, max_pages)
+        self.max_uses = max(1, max_uses)
+        self.ready_timeout = ready_timeout
+        self.network_idle_timeout = network_idle_timeout
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._playwright = None
+        self._browser = None
+        self._browser_lock = None
+        self._slots = None
+        self._idle_contexts = []
+        self._context_uses = {}
+
+    def render(self, url, timeout=NAVIGATION_TIMEOUT + READY_TIMEOUT + 15):
+        """Load ``url`` and return its HTML once the page looks ready."""
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._render(url), self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def render_async(self, url, timeout=NAVIGATION_TIMEOUT + READY_TIMEOUT + 15):
+        """``render`` for coroutines: awaits the pool's loop, and cancelling the caller cancels the render."""
+        if self._loop is None:
+            await asyncio.to_thread(self._ensure_started)
+        future = asyncio.run_coroutine_threadsafe(self._render(url), self._loop)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        if self._loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(30)
+        except Exception as e:
+            logging.warning(f"Browser pool did not shut down cleanly: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="browser-pool", daemon=True)
+            thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self._startup(), loop).result(NAVIGATION_TIMEOUT)
+            except BaseException:
+                loop.call_soon_threadsafe(loop.stop)
+                raise
+            self._loop, self._thread = loop, thread
+
+    async def _startup(self):
+        from playwright.async_api import async_playwright
+        self._playwright = await async_playwright().start()
+        self._browser_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.max_pages)
+
+    async def _shutdown(self):
+        for context in self._idle_contexts:
+            await self._close_quietly(context)
+        self._idle_contexts.clear()
+        self._context_uses.clear()
+        if self._browser is not None:
+            await self._close_quietly(self._browser)
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _get_browser(self):
+        async with self._browser_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._browser is not None:
+                    logging.warning("Chromium disconnected, relaunching browser pool")
+                self._idle_contexts.clear()
+                self._context_uses.clear()
+                self._browser = await self._playwright.chromium.launch(headless=True)
+            return self._browser
+
+    async def _lease_context(self):
+        browser = await self._get_browser()
+        while self._idle_contexts:
+            context = self._idle_contexts.pop()
+            if context.browser is browser:
+                return context
+        context = await browser.new_context(
+            user_agent=USER_AGENT,
+            java_script_enabled=True,
+            viewport={"width": 1280, "height": 720},
+        )
+        self._context_uses[context] = 0
+        return context
+
+    async def _release_context(self, context, healthy):
+        uses = self._context_uses.get(context, 0) + 1
+        if healthy and uses < self.max_uses and context.browser is self._browser:
+            self._context_uses[context] = uses
+            self._idle_contexts.append(context)
+        else:
+            self._context_uses.pop(context, None)
+            await self._close_quietly(context)
+
+    async def _render(self, url):
+        async with self._slots:
+            context = await self._lease_context()
+            healthy = False
+            try:
+                page = await context.new_page()
+                try:
+                    await page.goto(url, wait_until="domcontentloaded", timeout=NAVIGATION_TIMEOUT * 1000)
+                    await self._wait_until_ready(page)
+                    html = await page.content()
+                finally:
+                    await self._close_quietly(page)
+                healthy = True
+                return html
+            finally:
+                await self._release_context(context, healthy)
+
+    async def _wait_until_ready(self, page):
+        """Wait for network idle, then for the visible text to stop changing, capped at ready_timeout."""
+        deadline = time.monotonic() + self.ready_timeout
+        try:
+            await page.wait_for_load_state("networkidle", timeout=self.network_idle_timeout * 1000)
+        except Exception:
+            pass
+
+        previous = -1
+        while time.monotonic() < deadline:
+            try:
+                length = await page.evaluate("document.body ? document.body.innerText.length : 0")
+            except Exception:
+                return
+            if length == previous and length > 0:
+                return
+            previous = length
+            await asyncio.sleep(STABLE_POLL_INTERVAL)
+
+    @staticmethod
+    async def _close_quietly(resource):
+        try:
+            await resource.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide BrowserPool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
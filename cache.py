@@ -0,0 +1,239 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DEFAULT_CACHE_PATH = os.getenv("ENRICHMENT_CACHE_PATH", ".enrichment_cache.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DAY = 24 * 60 * 60
+
+# Seconds each layer stays fresh. Metadata changes rarely, page text more often.
+DEFAULT_TTLS = {
+    'details': 30 * DAY,
+    'text': 7 * DAY,
+    'analysis': 30 * DAY,
+}
+
+# use: read and write, refresh: ignore existing entries but store new ones, bypass: no cache at all
+CACHE_MODES = ('use', 'refresh', 'bypass')
+
+MISS = object()
+
+# Per-thread (or per-task) mode set by ``use_mode``, overriding the cache's own.
+_mode_override = contextvars.ContextVar('cache_mode', default=None)
+
+
+class EnrichmentCache:
+    """SQLite-backed key/value cache split into layers with their own TTL.
+
+    Entries are evicted least-recently-used first once the stored values
+    exceed ``max_bytes``. Safe to share between threads.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_bytes=DEFAULT_MAX_BYTES, mode='use'):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " layer TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (layer, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _mode(self):
+        return _mode_override.get() or self.mode
+
+    def get(self, layer, key):
+        if self._mode() != 'use':
+            return MISS
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE layer = ? AND key = ?", (layer, key)
+            ).fetchone()
+            if row is None:
+                return MISS
+            value, created_at = row
+            if now - created_at > self.ttls.get(layer, 0):
+                self._delete(layer, key)
+                return MISS
+            self._conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE layer = ? AND key = ?", (now, layer, key)
+            )
+        return json.loads(value)
+
+    def set(self, layer, key, value, ttl=None):
+        """Store ``value``; a ``ttl`` shorter than the layer's makes this entry expire sooner."""
+        if self._mode() == 'bypass':
+            return
+        encoded = json.dumps(value)
+        size = len(encoded.encode('utf-8'))
+        now = time.time()
+        # Entries expire by age, so a shorter TTL is stored as an older creation time.
+        created_at = now - max(0, self.ttls.get(layer, 0) - ttl) if ttl is not None else now
+        with self._lock:
+            self._delete(layer, key)
+            self._conn.execute(
+                "INSERT INTO entries (layer, key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (layer, key, encoded, size, created_at, now)
+            )
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def clear(self, layer=None):
+        with self._lock:
+            if layer is None:
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._conn.execute("DELETE FROM entries WHERE layer = ?", (layer,))
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _delete(self, layer, key):
+        row = self._conn.execute(
+            "SELECT size FROM entries WHERE layer = ? AND key = ?", (layer, key)
+        ).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM entries WHERE layer = ? AND key = ?", (layer, key))
+            self._total_bytes -= row[0]
+
+    def _evict(self):
+        """Drop least-recently-used entries until the cache is back under 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        expired_before = time.time() - max(self.ttls.values())
+        self._conn.execute("DELETE FROM entries WHERE created_at < ?", (expired_before,))
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if self._total_bytes <= target:
+            return
+        freed = 0
+        victims = []
+        for layer, key, size in self._conn.execute(
+                "SELECT layer, key, size FROM entries ORDER BY accessed_at"):
+            victims.append((layer, key))
+            freed += size
+            if self._total_bytes - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM entries WHERE layer = ? AND key = ?", victims)
+        self._total_bytes -= freed
+        logging.info(f"Cache evicted {len(victims)} entries ({freed} bytes)")
+
+
+_cache = None
+_cache_settings = {}
+_cache_lock = threading.Lock()
+
+
+def configure(**settings):
+    """Set EnrichmentCache options (path, ttls, max_bytes, mode) for the shared cache."""
+    global _cache
+    with _cache_lock:
+        settings = {k: v for k, v in settings.items() if v is not None}
+        if all(_cache_settings.get(k) == v for k, v in settings.items()):
+            return
+        _cache_settings.update(settings)
+        if _cache is not None:
+            _cache.close()
+            _cache = None
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EnrichmentCache(**_cache_settings)
+        return _cache
+
+
+def use_mode(mode):
+    """Use ``mode`` (or the configured mode again, for None) for cache calls from the current thread or task.
+
+    Lets one job bypass or refresh the cache without changing it for other
+    jobs sharing the process.
+    """
+    if mode is not None and mode not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+    _mode_override.set(mode)
+
+
+def cached(layer, key, store_if=None, load=None, ttl=None):
+    """Cache a function's return value in ``layer`` under ``key(*args, **kwargs)``.
+
+    ``store_if(result)`` decides whether a result is worth keeping (e.g. skip
+    failures); ``ttl(result)`` can return a shorter lifetime in seconds for
+    results worth keeping only briefly (None for the layer's TTL); ``load``
+    turns the JSON-decoded value back into the original type.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            try:
+                cache = get_cache()
+                value = cache.get(layer, cache_key)
+            except sqlite3.Error as e:
+                logging.warning(f"Cache read failed ({e}), calling {fn.__name__} directly")
+                return fn(*args, **kwargs)
+            metrics.count('cache_lookups', layer=layer, result='miss' if value is MISS else 'hit')
+            if value is not MISS:
+                return load(value) if load else value
+            result = fn(*args, **kwargs)
+            if store_if is None or store_if(result):
+                try:
+                    cache.set(layer, cache_key, result, ttl(result) if ttl else None)
+                except sqlite3.Error as e:
+                    logging.warning(f"Cache write failed: {e}")
+            return result
+        def read(args, kwargs, count):
+            try:
+                value = get_cache().get(layer, key(*args, **kwargs))
+            except sqlite3.Error as e:
+                logging.warning(f"Cache read failed: {e}")
+                return MISS
+            if count:
+                metrics.count('cache_lookups', layer=layer, result='miss' if value is MISS else 'hit')
+            if value is MISS:
+                return MISS
+            return load(value) if load else value
+
+        def lookup(*args, **kwargs):
+            """Cached value for these arguments, or MISS."""
+            return read(args, kwargs, True)
+
+        def peek(*args, **kwargs):
+            """``lookup`` left out of the cache metrics, for probes that the real call will count."""
+            return read(args, kwargs, False)
+
+        def store(result, *args, **kwargs):
+            """Record a result computed outside the wrapper (e.g. in a batch)."""
+            if store_if is None or store_if(result):
+                try:
+                    get_cache().set(layer, key(*args, **kwargs), result, ttl(result) if ttl else None)
+                except sqlite3.Error as e:
+                    logging.warning(f"Cache write failed: {e}")
+
+        wrapper.uncached = fn
+        wrapper.lookup = lookup
+        wrapper.peek = peek
+        wrapper.store = store
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+"""Pick the website text sent to Gemini: the most business-relevant blocks that fit a token budget.
+
+A page is split into blocks by ``html_extract.text_blocks`` (which already
+drops nav, header, footer and cookie-banner text). Here repeated blocks are
+removed, blocks shared by the home and About pages are treated as site
+chrome, and the rest are scored for business relevance (what the company
+does, sells, and for whom) and packed greedily into the budget. The chosen
+blocks are returned in page order.
+"""
+import contextvars
+import os
+import re
+from urllib.parse import urljoin, urlparse
+
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTENT_TOKEN_BUDGET", "1200"))
+DEFAULT_ABOUT_PAGE = os.getenv("FETCH_ABOUT_PAGE", "").lower() in ("1", "true", "yes")
+MIN_TRUNCATED_TOKENS = 40  # don't end the selection on a shorter fragment than this
+
+# Words that mark text about the business itself rather than page furniture.
+BUSINESS_TERMS = re.compile(
+    r"\b(?:about|mission|vision|founded|headquarter\w*|company|business|customers?|clients?|industr\w+"
+    r"|products?|services?|solutions?|platform|software|manufactur\w+|provid\w+|offer\w*|helps?"
+    r"|enterprises?|teams?|market\w*|retail\w*|partners?|employees|people|global|leading|specializ\w+"
+    r"|revenue|operations|technology|automation|analytics|data|cloud|security|healthcare|financ\w+"
+    r"|logistics|consult\w+|brands?|we (?:are|build|make|help|serve|design|develop))\b",
+    re.IGNORECASE)
+BOILERPLATE = re.compile(
+    r"cookie|privacy policy|terms (?:of|and) (?:use|service)|all rights reserved|©|copyright"
+    r"|sign (?:in|up)|log ?in|subscribe|newsletter|javascript|browser is out of date|skip to",
+    re.IGNORECASE)
+
+_token_budget = DEFAULT_TOKEN_BUDGET
+_about_page = DEFAULT_ABOUT_PAGE
+_about_page_override = contextvars.ContextVar('about_page', default=None)
+
+
+def configure(token_budget=None, about_page=None):
+    """Set the website-text token budget per company and whether the About page is read too."""
+    global _token_budget, _about_page
+    if token_budget is not None:
+        _token_budget = max(1, int(token_budget))
+    if about_page is not None:
+        _about_page = bool(about_page)
+
+
+def token_budget():
+    return _token_budget
+
+
+def use_about_page(enabled):
+    """Override ``configure(about_page=...)`` for the current thread or task (None restores it)."""
+    _about_page_override.set(None if enabled is None else bool(enabled))
+
+
+def about_page_enabled():
+    enabled = _about_page_override.get()
+    return _about_page if enabled is None else enabled
+
+
+def settings_key():
+    """Short key for the current settings, so cached page text is reselected when they change."""
+    return f"t{_token_budget}{'+about' if about_page_enabled() else ''}"
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) used for budgets and batch packing."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def about_url(url, href=None):
+    """Absolute URL of the site's About page: ``href`` if it stays on the same host, else ``/about``."""
+    if href:
+        candidate = urljoin(url, href)
+        if urlparse(candidate).netloc == urlparse(url).netloc and candidate.rstrip('/') != url.rstrip('/'):
+            return candidate
+    return urljoin(url, '/about')
+
+
+def _key(text):
+    return ' '.join(text.casefold().split())
+
+
+def score_block(text, is_heading, link_ratio, position, about=False):
+    """Business relevance of one block; zero or less means it isn't worth prompt tokens."""
+    words = len(text.split())
+    relevance = len(BUSINESS_TERMS.findall(text))
+    score = min(relevance, 6) * 1.5 + min(words, 80) / 20 + (1 - position) * 4
+    if is_heading:
+        score += 3
+    elif words < 5:
+        score -= 3  # buttons and calls to action: "Start free trial", "Learn more"
+    if BOILERPLATE.search(text):
+        score -= 4
+    if about:
+        score += 2
+    return score * (1 - link_ratio)
+
+
+def _candidates(blocks, page, about, skip, seen):
+    """(score, page, index, text) for the distinct blocks of one page that aren't in ``skip``."""
+    result, dropped = [], 0
+    for i, (text, is_heading, link_ratio) in enumerate(blocks):
+        key = _key(text)
+        if key in seen or key in skip:
+            dropped += 1
+            continue
+        seen.add(key)
+        result.append((score_block(text, is_heading, link_ratio, i / max(1, len(blocks)), about), page, i, text))
+    return result, dropped
+
+
+def _truncate(text, tokens):
+    cut = text[:tokens * CHARS_PER_TOKEN]
+    return cut.rsplit(' ', 1)[0] if ' ' in cut else cut
+
+
+def select(blocks, about_blocks=(), budget=None):
+    """Best blocks of the page (and its About page) within ``budget`` tokens, joined in page order.
+
+    Returns ``(text, dropped)`` where ``dropped`` counts repeated blocks and
+    blocks shared by both pages that were left out.
+    """
+    budget = budget or _token_budget
+    shared = {_key(b[0]) for b in blocks} & {_key(b[0]) for b in about_blocks}
+    seen = set()
+    candidates, dropped = _candidates(blocks, 0, False, shared, seen)
+    about_candidates, about_dropped = _candidates(about_blocks, 1, True, shared, seen)
+    candidates += about_candidates
+    dropped += about_dropped
+
+    ranked = sorted((c for c in candidates if c[0] > 0), key=lambda c: -c[0])
+    if not ranked:
+        ranked = candidates  # nothing looks relevant: fall back to page order
+    chosen, used = [], 0
+    for score, page, i, text in ranked:
+        cost = estimate_tokens(text)
+        if used + cost <= budget:
+            chosen.append((page, i, text))
+            used += cost
+        elif budget - used >= MIN_TRUNCATED_TOKENS:
+            chosen.append((page, i, _truncate(text, budget - used)))
+            break
+    return '\n'.join(text for _, _, text in sorted(chosen)), dropped
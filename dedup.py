@@ -0,0 +1,108 @@
+"""Normalisation keys used to fetch and analyze each distinct company / site only once."""
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import urlparse
+
+# Trailing legal-form words, each mapped to one spelling.
+LEGAL_FORMS = {
+    'inc': 'inc', 'incorporated': 'inc', 'corp': 'corporation', 'corporation': 'corporation',
+    'co': 'company', 'company': 'company', 'ltd': 'limited', 'limited': 'limited',
+    'llc': 'llc', 'llp': 'llp', 'plc': 'plc', 'gmbh': 'gmbh', 'ag': 'ag', 'sa': 'sa', 'bv': 'bv',
+    'nv': 'nv', 'pvt': 'private', 'private': 'private', 'pty': 'pty',
+}
+DEFAULT_MEMO_SIZE = 100000
+
+
+def company_words(name):
+    """Case-, width- and punctuation-insensitive words of a company name, in any script.
+
+    Accents are dropped from Latin letters only ("Nestlé" -> "nestle");
+    names in other scripts keep every character.
+    """
+    chars, base = [], ''
+    for ch in unicodedata.normalize('NFKD', str(name)):
+        if unicodedata.combining(ch):
+            if base >= '\x80':
+                chars.append(ch)
+            continue
+        chars.append(ch)
+        base = ch
+    text = unicodedata.normalize('NFKC', ''.join(chars)).casefold().replace('&', ' and ')
+    return ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in text).split()
+
+
+def _trailing_legal_forms(words):
+    end = len(words)
+    while end > 1 and words[end - 1] in LEGAL_FORMS:
+        end -= 1
+    return end
+
+
+def normalize_company(name):
+    """Key shared by names of the same company: "ZOHO Corp." and "Zoho Corporation" map to "zoho corporation".
+
+    Trailing legal forms are spelled one way but kept, so "Target" and
+    "Target Corp." stay apart. Names without letters or digits fall back to
+    their stripped text, so the key is never empty for a non-blank name.
+    """
+    words = company_words(name)
+    end = _trailing_legal_forms(words)
+    key = ' '.join(words[:end] + [LEGAL_FORMS[word] for word in words[end:]])
+    return key or str(name).strip().casefold()
+
+
+def brand_words(name):
+    """``company_words`` without trailing legal forms, as a domain would spell them ("Acme Widgets Ltd" -> acme, widgets)."""
+    words = company_words(name)
+    return words[:_trailing_legal_forms(words)]
+
+
+def normalize_url(url):
+    """Scheme-, www- and trailing-slash-insensitive key for a website URL."""
+    url = str(url).strip()
+    if '://' not in url:
+        url = 'https://' + url.lstrip('/')
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    return host + parsed.path.rstrip('/')
+
+
+def content_hash(text):
+    """Digest of extracted page text, ignoring case and whitespace differences."""
+    normalized = ' '.join(text.casefold().split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class FutureMemo:
+    """Thread-safe map from a dedup key to the Future computing its result.
+
+    The first caller to ``claim`` a key becomes its owner and must settle the
+    returned Future; later callers share it. Only the most recent
+    ``max_entries`` keys are remembered, so memory stays bounded on long runs.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MEMO_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self._futures.move_to_end(key)
+                self.hits += 1
+                return future, False
+            future = Future()
+            self._futures[key] = future
+            if len(self._futures) > self.max_entries:
+                self._futures.popitem(last=False)
+            return future, True
@@ -0,0 +1,275 @@
+"""Local index of company websites, so most websites are resolved without a Google search.
+
+Every website the pipeline finds (from a Wikipedia infobox or article, a
+checked domain guess or a search) is recorded under the company's
+normalized name and its Wikipedia title. A company without a Wikipedia
+website is then resolved, in order, by:
+
+1. an exact match on its normalized name ("ZOHO Corp." finds "Zoho Corporation"),
+2. a fuzzy match against indexed names with the same prefix (typos, extra words),
+3. guessed domains (``acmewidgets.com``, ``acme-widgets.com``, ...) that
+   resolve in DNS and answer a HEAD request on a host matching the name,
+4. and only then a Google search (in ``scraper3``).
+
+Guessed websites are trusted for GUESS_TTL and never replace a website
+learned from Wikipedia or a search; searches that found nothing are
+remembered for NEGATIVE_TTL so the same company isn't searched again on
+every run.
+"""
+import difflib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import dedup
+import http_client
+import metrics
+
+DEFAULT_INDEX_PATH = os.getenv("DOMAIN_INDEX_PATH", ".domain_index.sqlite3")
+DEFAULT_GUESS = os.getenv("DOMAIN_GUESS", "1").lower() not in ("0", "false", "no")
+NEGATIVE_TTL = 7 * 24 * 60 * 60
+GUESS_TTL = 30 * 24 * 60 * 60
+
+FUZZY_CUTOFF = 0.92         # difflib ratio a fuzzy match needs
+MIN_FUZZY_LENGTH = 6        # shorter names only match exactly ("apple" vs "apples")
+FUZZY_PREFIX = 4            # candidates share this many leading characters
+FUZZY_CANDIDATES = 500
+
+GUESS_TLDS = ('com', 'io', 'co', 'ai', 'net')
+MAX_GUESSES = 6
+MAX_GUESS_LABEL = 30        # longer names rarely are their own domain
+HEAD_TIMEOUT = 5
+# Second-level labels of country domains like co.uk or com.au.
+SECOND_LEVEL_LABELS = {'co', 'com', 'net', 'org', 'ac', 'gov', 'edu', 'ltd', 'plc'}
+
+SOURCE_INDEX = 'domain_index'
+SOURCE_GUESS = 'domain_guess'
+
+
+def domain_label(url):
+    """Name part of a URL's registrable domain: "acme-widgets" for https://www.acme-widgets.co.uk/about."""
+    url = str(url).strip()
+    host = urlparse(url if '://' in url else 'https://' + url).hostname or ''
+    labels = [label for label in host.lower().split('.') if label]
+    if labels and labels[0] == 'www':
+        labels = labels[1:]
+    if len(labels) >= 3 and len(labels[-1]) == 2 and labels[-2] in SECOND_LEVEL_LABELS:
+        labels = labels[:-2]
+    elif len(labels) >= 2:
+        labels = labels[:-1]
+    label = labels[-1] if labels else ''
+    if label.startswith('xn--'):
+        try:
+            label = label.encode('ascii').decode('idna')
+        except UnicodeError:
+            pass
+    return label
+
+
+def name_tokens(company_name):
+    """Words of the normalized name that a domain would spell out ("The Home Depot" -> home, depot)."""
+    tokens = dedup.brand_words(company_name)
+    if len(tokens) > 1 and tokens[0] == 'the':
+        tokens = tokens[1:]
+    return tokens
+
+
+def name_spellings(company_name):
+    """Domain labels that spell out the whole name: "AT&T" -> atandt, att; three or more words also by initials."""
+    tokens = name_tokens(company_name)
+    core = [token for token in tokens if token != 'and'] or tokens
+    spellings = {''.join(tokens), ''.join(core)} - {''}
+    if len(core) >= 3:
+        spellings.add(''.join(token[0] for token in core))
+    return spellings
+
+
+def matches_name(company_name, url):
+    """True if ``url``'s domain spells out the company's whole name.
+
+    "Acme Widgets" matches acmewidgets.com and acme-widgets.co.uk, but not
+    acme.com, widgets.com or linkedin.com/company/acme-widgets; names of
+    three or more words also match their initials (tcs.com).
+    """
+    label = ''.join(dedup.company_words(domain_label(url)))
+    return bool(label) and label in name_spellings(company_name)
+
+
+def candidate_domains(company_name):
+    """Likely domains for a company name, most likely first."""
+    tokens = name_tokens(company_name)
+    compact = ''.join(tokens)
+    if not 3 <= len(compact) <= MAX_GUESS_LABEL or not compact.isascii():
+        return []
+    labels = [compact] + (['-'.join(tokens)] if len(tokens) > 1 else [])
+    return [f"{label}.{tld}" for tld in GUESS_TLDS for label in labels][:MAX_GUESSES]
+
+
+def check_domain(company_name, domain):
+    """Website URL if ``domain`` resolves and answers on a host that still matches the name, else None."""
+    try:
+        socket.getaddrinfo(domain, 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        return None
+    try:
+        response = http_client.head(f"https://{domain}/", timeout=HEAD_TIMEOUT)
+    except Exception as e:
+        logging.debug(f"HEAD https://{domain}/ failed: {e}")
+        return None
+    if response.status_code >= 400:
+        return None
+    if not matches_name(company_name, response.url):
+        return None  # redirected elsewhere, e.g. to a domain parking page
+    final = urlparse(response.url)
+    return f"{final.scheme}://{final.netloc}"
+
+
+def guess_website(company_name):
+    """First candidate domain that checks out, or None."""
+    with metrics.span('domain_guess'):
+        for domain in candidate_domains(company_name):
+            website = check_domain(company_name, domain)
+            if website:
+                return website
+    return None
+
+
+def _rows(names, website, source, now):
+    rows = []
+    for name in names:
+        key = dedup.normalize_company(name)
+        if key:
+            rows.append((key, name, website, source, now))
+    return rows
+
+
+class DomainIndex:
+    """SQLite table of normalized company name -> website, with where it was learned. Safe to share between threads."""
+
+    def __init__(self, path=DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS names ("
+            " key TEXT PRIMARY KEY, name TEXT NOT NULL, website TEXT NOT NULL,"
+            " source TEXT NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def lookup(self, company_name):
+        """``(website, via)`` from the index, where via is 'exact', 'fuzzy' or 'negative'; None if unknown.
+
+        A 'negative' hit is a recent search that found nothing; its website is
+        'N/A'. Guessed websites older than GUESS_TTL count as unknown, and
+        fuzzy matches only consider websites that weren't guessed.
+        """
+        key = dedup.normalize_company(company_name)
+        if not key:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT website, source, updated_at FROM names WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                website, source, updated_at = row
+                if website == 'N/A':
+                    if now - updated_at < NEGATIVE_TTL:
+                        return website, 'negative'
+                elif source != SOURCE_GUESS or now - updated_at < GUESS_TTL:
+                    return website, 'exact'
+            if len(key) < MIN_FUZZY_LENGTH:
+                return None
+            prefix = key[:FUZZY_PREFIX]
+            candidates = self._conn.execute(
+                "SELECT key, website FROM names WHERE key >= ? AND key < ? AND website != 'N/A' AND source != ?"
+                " LIMIT ?", (prefix, prefix + '\U0010ffff', SOURCE_GUESS, FUZZY_CANDIDATES)
+            ).fetchall()
+        matcher = difflib.SequenceMatcher(b=key)
+        best, best_ratio = None, FUZZY_CUTOFF
+        for candidate, website in candidates:
+            matcher.set_seq1(candidate)
+            if matcher.real_quick_ratio() >= best_ratio and matcher.quick_ratio() >= best_ratio:
+                ratio = matcher.ratio()
+                if ratio >= best_ratio:
+                    best, best_ratio = website, ratio
+        return (best, 'fuzzy') if best else None
+
+    def record(self, company_name, website, source, aliases=()):
+        """Remember ``website`` (or 'N/A' after a search found nothing) for the name and its aliases."""
+        rows = _rows((company_name,) + tuple(aliases), website, source, time.time())
+        if rows:
+            with self._lock:
+                self._upsert(rows)
+
+    def _upsert(self, rows):
+        # Wikipedia and search results replace anything; a guess only replaces a negative
+        # or another guess, and a negative only an expired guess.
+        now = time.time()
+        self._conn.executemany(
+            "INSERT INTO names (key, name, website, source, updated_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (key) DO UPDATE SET name = excluded.name, website = excluded.website,"
+            " source = excluded.source, updated_at = excluded.updated_at"
+            " WHERE (excluded.website != 'N/A' AND excluded.source != ?)"
+            " OR (excluded.source = ? AND (names.website = 'N/A' OR names.source = ?))"
+            " OR (excluded.website = 'N/A' AND (names.website = 'N/A'"
+            "     OR (names.source = ? AND names.updated_at < ?)))",
+            [row + (SOURCE_GUESS, SOURCE_GUESS, SOURCE_GUESS, SOURCE_GUESS, now - GUESS_TTL) for row in rows]
+        )
+
+    def import_store(self, store):
+        """Index every website already in an ``entity_store.EntityStore``; returns how many were added."""
+        now = time.time()
+        rows = []
+        for name, website, source in store.values('Website'):
+            if website not in ('', 'N/A'):
+                rows += _rows((name,), website, source, now)
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._upsert(rows)
+            self._conn.execute("COMMIT")
+        return len(rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM names WHERE website != 'N/A'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_index = None
+_settings = {'path': DEFAULT_INDEX_PATH, 'guess': DEFAULT_GUESS}
+_index_lock = threading.Lock()
+
+
+def configure(path=None, guess=None):
+    """Set the shared index's file and whether unknown companies get domain guesses before a search."""
+    global _index
+    with _index_lock:
+        if guess is not None:
+            _settings['guess'] = bool(guess)
+        if path is not None and path != _settings['path']:
+            _settings['path'] = path
+            if _index is not None:
+                _index.close()
+                _index = None
+
+
+def guessing_enabled():
+    return _settings['guess']
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DomainIndex(_settings['path'])
+        return _index
@@ -0,0 +1,523 @@
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+
+from scraper3 import get_company_details
+from llm3 import (
+    analyze_company_website, analyze_content, analyze_contents_batch, extract_visible_text,
+    batch_item_tokens, BATCH_OVERHEAD_TOKENS, MAX_BATCH_COMPANIES
+)
+from cache import MISS
+import cache
+import content_select
+import dedup
+import metrics
+import wiki_bulk
+
+METADATA_FIELDS = ['Website', 'Industry', 'Company Size', 'HQ Location']
+ANALYSIS_FIELDS = ['Summary', 'Target Customer', 'AI Automation Idea']
+OUTPUT_COLUMNS = METADATA_FIELDS + ANALYSIS_FIELDS
+
+DEFAULT_LOOKUP_WORKERS = 8
+DEFAULT_ANALYSIS_WORKERS = 4
+
+# Longest a fetched website waits for more companies before its batch goes to Gemini.
+BATCH_MAX_WAIT = 2.0
+
+NA_ANALYSIS = ("N/A", "N/A", "N/A")
+
+# Sources recorded in the entity store besides the scraper3.SOURCE_* lookups.
+SOURCE_INPUT = 'input'
+SOURCE_LLM = 'llm'
+
+
+def is_missing(value):
+    """True for empty cells: NaN/None, blank strings and the 'N/A' placeholder."""
+    if isinstance(value, str):
+        return value.strip() in ('', 'N/A')
+    if value is None:
+        return True
+    import pandas as pd  # NaN/NaT/NA cells only come from DataFrames, so pandas is loaded already
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def empty_details(company):
+    return {
+        'Company Name': company,
+        'Website': 'N/A',
+        'Industry': 'N/A',
+        'Company Size': 'N/A',
+        'HQ Location': 'N/A',
+        'Sources': {},
+    }
+
+
+def needs_lookup(row, known=()):
+    """True if a metadata field is neither in the row nor in ``known`` (fresh values from the entity store)."""
+    return any(is_missing(row.get(field)) and field not in known for field in METADATA_FIELDS)
+
+
+def prefetch_wikipedia(rows):
+    """Bulk-resolve the Wikipedia pages for rows that will need a (non-cached) lookup."""
+    names = {}
+    for row in rows:
+        company = row['company_name']
+        if not isinstance(company, str) or not company.strip():
+            continue
+        if needs_lookup(row) and get_company_details.peek(company) is MISS:
+            names.setdefault(dedup.normalize_company(company), company)
+    if names:
+        wiki_bulk.prefetch(list(names.values()))
+
+
+def lookup_details(row, prefetched=None, known=None):
+    """Stage 1: Wikipedia/Google metadata, reusing the row's own (and ``known``) values when all are present."""
+    company = row['company_name']
+    known = known or {}
+    if needs_lookup(row, known):
+        if prefetched is not None:
+            try:
+                prefetched.result()
+            except Exception as e:
+                # Each page is then fetched on its own by wiki_bulk.take.
+                logging.warning(f"Wikipedia prefetch failed: {e}")
+        try:
+            return get_company_details(company)
+        except Exception as e:
+            logging.warning(f"Metadata lookup failed for {company}: {e}")
+            return empty_details(company)
+
+    details = {'Company Name': company, 'Sources': {}}
+    for field in METADATA_FIELDS:
+        if is_missing(row.get(field)):
+            details[field] = known[field]
+        else:
+            details[field] = row[field]
+            details['Sources'][field] = SOURCE_INPUT
+    return details
+
+
+def _settle(future, fn, *args):
+    """Run ``fn(*args)`` and put its result (or exception) into ``future``."""
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def _chain(source, target):
+    """Complete ``target`` with whatever ``source`` completes with."""
+    def copy(done):
+        error = done.exception()
+        if error is not None:
+            target.set_exception(error)
+        else:
+            target.set_result(done.result())
+    source.add_done_callback(copy)
+
+
+def analyze_site(details, content_memo):
+    """Stage 2: website scrape + Gemini analysis, with one Gemini call per distinct page text."""
+    url, company = details['Website'], details['Company Name']
+    try:
+        cached_result = analyze_company_website.lookup(url, company)
+        if cached_result is not MISS:
+            return cached_result
+        content = extract_visible_text(url)
+        if not content:
+            return NA_ANALYSIS
+        future, owner = content_memo.claim(dedup.content_hash(content))
+        if owner:
+            _settle(future, analyze_content, content, company)
+        result = future.result()
+        analyze_company_website.store(result, url, company)
+        return result
+    except Exception as e:
+        logging.warning(f"Website analysis failed for {company}: {e}")
+        return NA_ANALYSIS
+
+
+def build_result(details, analysis):
+    result = {field: details[field] for field in METADATA_FIELDS}
+    result.update(zip(ANALYSIS_FIELDS, analysis))
+    return result
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class AnalysisBatcher:
+    """Collects fetched website texts and sends them to Gemini in token-budgeted batches.
+
+    A batch is dispatched as soon as the next company would not fit the
+    budget, or ``max_wait`` seconds after its first company arrived.
+    ``close()`` must run before ``pool`` shuts down.
+    """
+
+    def __init__(self, pool, token_budget, max_wait=BATCH_MAX_WAIT):
+        self.pool = pool
+        self.token_budget = token_budget
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._items = []
+        self._tokens = BATCH_OVERHEAD_TOKENS
+        self._timer = None
+        self._closed = False
+
+    def add(self, details, content, future):
+        cost = batch_item_tokens(details['Company Name'], content)
+        with self._lock:
+            if not self._closed:
+                if self._items and (self._tokens + cost > self.token_budget
+                                    or len(self._items) >= MAX_BATCH_COMPANIES):
+                    self._dispatch()
+                self._items.append((details, content, future))
+                self._tokens += cost
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        future.set_result(NA_ANALYSIS)
+
+    def flush(self):
+        with self._lock:
+            if not self._closed:
+                self._dispatch()
+
+    def close(self):
+        """Cancel the pending timer; companies still queued (or added later) get N/A without a Gemini call."""
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            items, self._items = self._items, []
+        for _, _, future in items:
+            future.set_result(NA_ANALYSIS)
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._items = self._items, []
+        self._tokens = BATCH_OVERHEAD_TOKENS
+        if items:
+            self.pool.submit(self._run, items)
+
+    def _run(self, items):
+        try:
+            results = analyze_contents_batch(
+                [(details['Company Name'], content) for details, content, _ in items], self.token_budget
+            )
+        except Exception as e:
+            logging.warning(f"Batched analysis failed for {len(items)} companies: {e}")
+            results = [NA_ANALYSIS] * len(items)
+        for (details, _, future), result in zip(items, results):
+            analyze_company_website.store(result, details['Website'], details['Company Name'])
+            future.set_result(result)
+
+
+def prepare_batched_analysis(details, batcher, content_memo, future):
+    """Batched stage 2: resolve from cache or fetch the website text and hand it to the batcher."""
+    try:
+        cached_result = analyze_company_website.lookup(details['Website'], details['Company Name'])
+        if cached_result is not MISS:
+            future.set_result(cached_result)
+            return
+        content = extract_visible_text(details['Website'])
+    except Exception as e:
+        logging.warning(f"Website fetch failed for {details['Company Name']}: {e}")
+        content = ""
+    if not content:
+        future.set_result(NA_ANALYSIS)
+        return
+    content_future, owner = content_memo.claim(dedup.content_hash(content))
+    if owner:
+        batcher.add(details, content, content_future)
+    _chain(content_future, future)
+
+
+class _Run:
+    """Pools, batcher and dedup memos for one EnrichmentEngine.enrich call."""
+
+    def __init__(self, lookup_pool, analysis_pool, batcher):
+        self.lookup_pool = lookup_pool
+        self.analysis_pool = analysis_pool
+        self.batcher = batcher
+        self.companies = dedup.FutureMemo()   # normalized company name -> details
+        self.sites = dedup.FutureMemo()       # normalized website URL -> analysis
+        self.contents = dedup.FutureMemo()    # page text hash -> analysis
+
+
+class EnrichmentEngine:
+    """Runs the lookup and analysis stages as two concurrent thread pools.
+
+    Rows are pulled lazily from the input iterable and at most ``max_in_flight``
+    rows are pending at once; results are yielded in input order. With a
+    ``batch_token_budget`` the analysis stage only fetches website text and
+    Gemini is called once per batch of companies instead of once per row.
+
+    Duplicate work is shared: rows whose company names normalize the same
+    are looked up once, each website is scraped once, and pages with
+    identical text are sent to Gemini once.
+
+    With an ``entity_store.EntityStore`` only the fields that are missing
+    or stale in the store are looked up (and the website analyzed only if
+    its fields are), and everything found is recorded there.
+
+    ``cache_mode`` and ``about_page`` override ``cache.configure`` and
+    ``content_select.configure`` for this engine's workers only.
+    """
+
+    def __init__(self, lookup_workers=DEFAULT_LOOKUP_WORKERS,
+                 analysis_workers=DEFAULT_ANALYSIS_WORKERS, max_in_flight=None,
+                 batch_token_budget=None, store=None, cache_mode=None, about_page=None):
+        self.lookup_workers = max(1, int(lookup_workers))
+        self.analysis_workers = max(1, int(analysis_workers))
+        self.max_in_flight = max_in_flight or 4 * (self.lookup_workers + self.analysis_workers)
+        self.batch_token_budget = batch_token_budget
+        self.store = store
+        self.cache_mode = cache_mode
+        self.about_page = about_page
+
+    def _init_worker(self):
+        cache.use_mode(self.cache_mode)
+        content_select.use_about_page(self.about_page)
+
+    def _pool(self, workers, name):
+        return ThreadPoolExecutor(workers, thread_name_prefix=name, initializer=self._init_worker)
+
+    def _stored(self, rows):
+        """(stored entry, fresh values) per row, read from the store in one query."""
+        if self.store is None:
+            return [({}, {})] * len(rows)
+        entries = self.store.get_many(row['company_name'] for row in rows)
+        now = time.time()
+        result = []
+        for row in rows:
+            entry = entries.get(self.store.key(row['company_name']), {})
+            known = self.store.fresh_values(entry, now)
+            metrics.count('store_fields', len(known), result='fresh')
+            result.append((entry, known))
+        return result
+
+    def _record_details(self, row, entry, known, details):
+        """Store the metadata the row was given or looked up, keeping earlier values a lookup missed."""
+        sources = details.pop('Sources', {})
+        if needs_lookup(row, known):
+            fields = METADATA_FIELDS
+            metrics.count('store_fields', len(fields), result='refreshed')
+        else:
+            fields = list(sources)
+        details.update(self.store.merge(row['company_name'], entry, {f: details[f] for f in fields}, sources))
+        return details
+
+    def _record_analysis(self, company, entry, analysis):
+        values = dict(zip(ANALYSIS_FIELDS, analysis))
+        sources = {field: SOURCE_LLM for field, value in values.items() if not is_missing(value)}
+        values = self.store.merge(company, entry, values, sources)
+        metrics.count('store_fields', len(ANALYSIS_FIELDS), result='refreshed')
+        return tuple(values[field] for field in ANALYSIS_FIELDS)
+
+    @staticmethod
+    def _stored_analysis(entry, known, details):
+        """The stored analysis if it is fresh and was made from the same website, else None."""
+        if not all(field in known for field in ANALYSIS_FIELDS):
+            return None
+        website = entry.get('Website')
+        if website is None or dedup.normalize_url(website.value) != dedup.normalize_url(details['Website']):
+            return None
+        return tuple(known[field] for field in ANALYSIS_FIELDS)
+
+    def _submit(self, run, row, prefetched, entry, known):
+        row_future = Future()
+        company = row['company_name']
+
+        def on_analysis(details, analysis_future):
+            try:
+                analysis = analysis_future.result()
+                if self.store is not None:
+                    analysis = self._record_analysis(company, entry, analysis)
+                row_future.set_result(build_result(details, analysis))
+            except Exception as e:
+                row_future.set_exception(e)
+
+        def on_details(details_future):
+            try:
+                details = dict(details_future.result())
+                details['Company Name'] = company
+                if self.store is not None:
+                    details = self._record_details(row, entry, known, details)
+                if details['Website'] == 'N/A':
+                    row_future.set_result(build_result(details, NA_ANALYSIS))
+                    return
+                analysis = self._stored_analysis(entry, known, details)
+                if analysis is not None:
+                    row_future.set_result(build_result(details, analysis))
+                    return
+                site_future, owner = run.sites.claim(dedup.normalize_url(details['Website']))
+                if owner and run.batcher is None:
+                    run.analysis_pool.submit(_settle, site_future, analyze_site, details, run.contents)
+                elif owner:
+                    run.analysis_pool.submit(prepare_batched_analysis, details, run.batcher,
+                                             run.contents, site_future)
+                site_future.add_done_callback(lambda f: on_analysis(details, f))
+            except Exception as e:
+                row_future.set_exception(e)
+
+        if needs_lookup(row, known):
+            details_future, owner = run.companies.claim(dedup.normalize_company(company))
+            if owner:
+                run.lookup_pool.submit(_settle, details_future, lookup_details, row, prefetched, known)
+        else:
+            details_future = Future()
+            details_future.set_result(lookup_details(row, known=known))
+        details_future.add_done_callback(on_details)
+        return row_future
+
+    @staticmethod
+    def _finish(entry):
+        row, future = entry
+        result = future.result()
+        metrics.count('rows')
+        return row, result
+
+    def enrich(self, rows):
+        """Yield ``(row, result)`` pairs in input order, where result maps OUTPUT_COLUMNS to values."""
+        with ExitStack() as stack:
+            if self.store is not None:
+                stack.callback(self.store.flush)  # runs last, once the pools have finished
+            lookup_pool = stack.enter_context(self._pool(self.lookup_workers, 'lookup'))
+            analysis_pool = stack.enter_context(self._pool(self.analysis_workers, 'analysis'))
+            batcher = None
+            if self.batch_token_budget:
+                gemini_pool = stack.enter_context(self._pool(self.analysis_workers, 'gemini'))
+                batcher = AnalysisBatcher(gemini_pool, self.batch_token_budget)
+                stack.callback(batcher.close)  # before gemini_pool shuts down
+            run = _Run(lookup_pool, analysis_pool, batcher)
+
+            pending = deque()
+            for chunk in _chunks(rows, wiki_bulk.BATCH_SIZE):
+                stored = self._stored(chunk)
+                # Queued ahead of the chunk's lookups, which wait for it before running.
+                prefetched = lookup_pool.submit(
+                    prefetch_wikipedia, [row for row, (_, known) in zip(chunk, stored) if needs_lookup(row, known)])
+                for row, (entry, known) in zip(chunk, stored):
+                    pending.append((row, self._submit(run, row, prefetched, entry, known)))
+                    while len(pending) >= self.max_in_flight:
+                        yield self._finish(pending.popleft())
+            while pending:
+                yield self._finish(pending.popleft())
+            for kind, memo in (('company', run.companies), ('site', run.sites), ('content', run.contents)):
+                metrics.count('dedup_hits', memo.hits, kind=kind)
+            if run.companies.hits or run.sites.hits or run.contents.hits:
+                logging.info(f"Deduplicated {run.companies.hits} company lookups, {run.sites.hits} website "
+                             f"analyses and {run.contents.hits} Gemini calls for identical page text")
+
+
+def enrich_dataframe(df, lookup_workers=DEFAULT_LOOKUP_WORKERS,
+                     analysis_workers=DEFAULT_ANALYSIS_WORKERS, progress=None,
+                     batch_token_budget=None, store=None):
+    """Enrich every row of ``df`` in place and return it.
+
+    ``progress`` is called as ``progress(done, total, company)`` after each row;
+    ``store`` is an optional EntityStore (see EnrichmentEngine).
+    """
+    for col in OUTPUT_COLUMNS:
+        if col not in df.columns:
+            df[col] = 'N/A'
+
+    engine = EnrichmentEngine(lookup_workers, analysis_workers, batch_token_budget=batch_token_budget,
+                              store=store)
+    total = len(df)
+    results = []
+    for row, result in engine.enrich(df.to_dict('records')):
+        results.append(result)
+        if progress:
+            progress(len(results), total, row['company_name'])
+
+    for col in OUTPUT_COLUMNS:
+        df[col] = [result[col] for result in results]
+    return df
+
+
+class EnrichmentJob:
+    """Enriches a DataFrame on a background thread so a UI can poll its progress.
+
+    ``snapshot()`` returns the rows finished so far, in input order, with
+    the enrichment columns filled in. ``cancel()`` stops taking new rows;
+    the rows already in flight still finish and are kept. ``cache_mode``
+    and ``about_page`` apply to this job only (see EnrichmentEngine).
+    """
+
+    def __init__(self, df, lookup_workers=DEFAULT_LOOKUP_WORKERS,
+                 analysis_workers=DEFAULT_ANALYSIS_WORKERS, batch_token_budget=None,
+                 cache_mode=None, about_page=None):
+        self.df = df.reset_index(drop=True)
+        self.total = len(self.df)
+        self.engine = EnrichmentEngine(lookup_workers, analysis_workers, batch_token_budget=batch_token_budget,
+                                       cache_mode=cache_mode, about_page=about_page)
+        self.results = []
+        self.current = None
+        self.error = None
+        self._snapshot = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='enrichment-job', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    @property
+    def done(self):
+        return len(self.results)
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _rows(self):
+        for row in self.df.to_dict('records'):
+            if self._cancelled.is_set():
+                return
+            yield row
+
+    def _run(self):
+        try:
+            for row, result in self.engine.enrich(self._rows()):
+                self.results.append(result)
+                self.current = row['company_name']
+        except Exception as e:
+            logging.error(f"Enrichment job failed after {self.done} rows: {e}")
+            self.error = e
+
+    def snapshot(self):
+        """DataFrame of the rows enriched so far (rebuilt only when more rows have finished)."""
+        results = self.results[:]
+        if self._snapshot is None or len(self._snapshot) != len(results):
+            df = self.df.iloc[:len(results)].copy()
+            for col in OUTPUT_COLUMNS:
+                df[col] = [result[col] for result in results]
+            self._snapshot = df
+        return self._snapshot
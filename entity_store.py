@@ -0,0 +1,270 @@
+"""Durable per-company store of enriched fields, each with the source it came from and when.
+
+Unlike the lookup cache (``cache.py``), which memoizes individual Wikipedia,
+website and Gemini calls for a while, the store is the pipeline's record of
+what it knows about every company it has seen. A run checks it first and
+only looks up the fields that are missing or older than their maximum age,
+so a weekly refresh of a large lead list re-fetches just the stale part.
+
+Rows are keyed by ``dedup.normalize_company`` so "Zoho Corp." and "ZOHO
+Corporation" share one entry, while "Zoho" (no legal form) and names in
+other scripts get entries of their own. Blank names are never stored.
+
+Each value's source is one of ``input`` (the lead list itself),
+``wikipedia_infobox``, ``wikipedia_text``, ``domain_index``,
+``domain_guess``, ``google_search``, ``llm`` or ``not_found``. Stale
+fields are re-fetched through the usual cached calls, so a max age
+shorter than the cache TTL only takes effect with ``--cache refresh``.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import dedup
+
+DEFAULT_STORE_PATH = os.getenv("ENRICHMENT_STORE_PATH", ".enrichment_store.sqlite3")
+DAY = 24 * 60 * 60
+
+# Seconds a stored value stays fresh. Values no lookup could find ("N/A")
+# use MISSING_MAX_AGE instead; by default they are retried on every run.
+DEFAULT_MAX_AGE = {
+    'Website': 90 * DAY,
+    'Industry': 180 * DAY,
+    'Company Size': 90 * DAY,
+    'HQ Location': 365 * DAY,
+    'Summary': 60 * DAY,
+    'Target Customer': 60 * DAY,
+    'AI Automation Idea': 60 * DAY,
+}
+MISSING_MAX_AGE = 0
+FIELDS = list(DEFAULT_MAX_AGE)
+
+SOURCE_NOT_FOUND = 'not_found'
+SOURCE_UNKNOWN = 'unknown'  # e.g. values from lookup cache entries written before sources were kept
+WRITE_BATCH = 500       # buffered field writes per transaction
+READ_BATCH = 500        # company keys per SELECT ... IN (...)
+EXPORT_CHUNK = 50000    # companies per exported CSV chunk
+
+Field = namedtuple('Field', 'value source updated_at')
+
+
+def _missing(value):
+    return value is None or str(value).strip() in ('', 'N/A')
+
+
+def export_columns(sources=False):
+    """``company_name`` and FIELDS, each followed by "<field> Source" and "<field> Updated" with ``sources``."""
+    columns = ['company_name']
+    for field in FIELDS:
+        columns += [field, f'{field} Source', f'{field} Updated'] if sources else [field]
+    return columns
+
+
+def parse_max_age(spec):
+    """Parse a CLI spec like ``Industry=30`` (days) into (field, seconds); ``missing=7`` sets MISSING_MAX_AGE."""
+    try:
+        field, days = spec.split('=', 1)
+        seconds = float(days) * DAY
+    except ValueError:
+        raise ValueError(f"Invalid max age {spec!r}, expected FIELD=DAYS")
+    field = field.strip()
+    if field != 'missing' and field not in DEFAULT_MAX_AGE:
+        raise ValueError(f"Unknown field {field!r}, expected 'missing' or one of {FIELDS}")
+    return field, seconds
+
+
+class EntityStore:
+    """SQLite table of (company, field) -> value, source and update time.
+
+    ``max_age`` overrides DEFAULT_MAX_AGE per field (seconds; a ``'missing'``
+    entry overrides MISSING_MAX_AGE). Writes are buffered and committed in
+    batches; ``flush()`` or ``close()`` commits the rest. Safe to share
+    between threads.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, max_age=None):
+        max_age = dict(max_age or {})
+        self.path = path
+        self.missing_max_age = max_age.pop('missing', MISSING_MAX_AGE)
+        self.max_age = dict(DEFAULT_MAX_AGE, **max_age)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_names = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS companies ("
+            " key TEXT PRIMARY KEY, name TEXT NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fields ("
+            " company_key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL,"
+            " source TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (company_key, field)) WITHOUT ROWID"
+        )
+
+    @staticmethod
+    def key(name):
+        return dedup.normalize_company(name)
+
+    def get_many(self, names):
+        """``{key: {field: Field}}`` for the given company names (companies not stored are left out)."""
+        keys = list({self.key(name) for name in names} - {''})
+        entries = {}
+        with self._lock:
+            for start in range(0, len(keys), READ_BATCH):
+                batch = keys[start:start + READ_BATCH]
+                rows = self._conn.execute(
+                    "SELECT company_key, field, value, source, updated_at FROM fields"
+                    f" WHERE company_key IN ({', '.join('?' * len(batch))})", batch
+                )
+                for key, field, value, source, updated_at in rows:
+                    entries.setdefault(key, {})[field] = Field(value, source, updated_at)
+        return entries
+
+    def get(self, name):
+        return self.get_many([name]).get(self.key(name), {})
+
+    def is_fresh(self, field, stored, now=None):
+        if stored is None:
+            return False
+        age = (now or time.time()) - stored.updated_at
+        if _missing(stored.value):
+            return age < self.missing_max_age
+        return age < self.max_age.get(field, 0)
+
+    def fresh_values(self, entry, now=None):
+        """``{field: value}`` for the fields of a ``get_many`` entry that don't need refreshing."""
+        now = now or time.time()
+        return {field: stored.value for field, stored in entry.items() if self.is_fresh(field, stored, now)}
+
+    def merge(self, name, entry, values, sources):
+        """Record newly obtained ``values`` for ``name`` and return them merged with ``entry``.
+
+        A lookup that came back empty never replaces a value found earlier:
+        the old value is returned and left stale, so it is retried next run.
+        ``sources`` maps fields to where each value came from; empty values
+        without one are recorded as SOURCE_NOT_FOUND, others as SOURCE_UNKNOWN.
+        Nothing is recorded for a blank name.
+        """
+        if not self.key(name):
+            return dict(values)
+        now = time.time()
+        merged, writes = {}, []
+        for field, value in values.items():
+            stored = entry.get(field)
+            if _missing(value) and stored is not None and not _missing(stored.value):
+                merged[field] = stored.value
+                continue
+            merged[field] = value
+            source = sources.get(field) or (SOURCE_NOT_FOUND if _missing(value) else SOURCE_UNKNOWN)
+            writes.append((field, str(value), source, now))
+        if writes:
+            self._write(name, writes)
+        return merged
+
+    def _write(self, name, writes):
+        key = self.key(name)
+        with self._lock:
+            self._pending_names[key] = (name, writes[0][3])
+            self._pending.extend((key,) + write for write in writes)
+            if len(self._pending) >= WRITE_BATCH:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        pending, names = self._pending, self._pending_names
+        self._pending, self._pending_names = [], {}
+        try:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO companies (key, name, updated_at) VALUES (?, ?, ?)",
+                [(key, name, updated_at) for key, (name, updated_at) in names.items()]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO fields (company_key, field, value, source, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)", pending
+            )
+            self._conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self._conn.execute("ROLLBACK")
+            logging.warning(f"Entity store write failed, {len(pending)} field values not saved: {e}")
+
+    def count(self):
+        with self._lock:
+            self._flush()
+            return self._conn.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+
+    def values(self, field):
+        """``(company name, value, source)`` for every stored value of ``field``."""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.name, f.value, f.source FROM fields f JOIN companies c ON c.key = f.company_key"
+                " WHERE f.field = ?", (field,)
+            ).fetchall()
+        return rows
+
+    def iter_frames(self, sources=False, chunk=EXPORT_CHUNK):
+        """The whole store as DataFrames of ``export_columns(sources)``, ``chunk`` companies at a time."""
+        import pandas as pd
+
+        columns = export_columns(sources)
+        self.flush()
+        last_key = ''
+        while True:
+            with self._lock:
+                companies = self._conn.execute(
+                    "SELECT key, name FROM companies WHERE key > ? ORDER BY key LIMIT ?", (last_key, chunk)
+                ).fetchall()
+                if not companies:
+                    return
+                rows = {key: {'company_name': name} for key, name in companies}
+                for key, field, value, source, updated_at in self._conn.execute(
+                        "SELECT company_key, field, value, source, updated_at FROM fields"
+                        " WHERE company_key > ? AND company_key <= ?", (last_key, companies[-1][0])):
+                    row = rows.get(key)
+                    if row is None:
+                        continue
+                    row[field] = value
+                    if sources:
+                        row[f'{field} Source'] = source
+                        row[f'{field} Updated'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(updated_at))
+            last_key = companies[-1][0]
+            yield pd.DataFrame(list(rows.values()), columns=columns).fillna('N/A')
+
+    def export(self, path, sources=False):
+        """Write the store to ``path`` as CSV, or as a workbook if it ends in .xlsx; returns the row count."""
+        import pandas as pd
+        import export
+
+        if path.lower().endswith('.xlsx'):
+            if self.count() > export.MAX_XLSX_ROWS:
+                raise ValueError(f"{self.count()} companies don't fit in one Excel sheet; export to CSV instead")
+            frames = list(self.iter_frames(sources)) or [pd.DataFrame(columns=export_columns(sources))]
+            df = pd.concat(frames, ignore_index=True)
+            with open(path, 'wb') as f:
+                f.write(export.to_xlsx_bytes(df))
+            return len(df)
+        rows = 0
+        with open(path, 'wb') as f:
+            for df in self.iter_frames(sources):
+                f.write(export.to_csv_bytes(df, header=rows == 0))
+                rows += len(df)
+            if not rows:
+                f.write(export.to_csv_bytes(pd.DataFrame(columns=export_columns(sources))))
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
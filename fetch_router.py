@@ -0,0 +1,264 @@
+"""Per-domain choice between plain requests, Playwright and ScrapingBee for fetching websites.
+
+Every site is fetched with the cheapest tier first. A page that comes
+back as a JavaScript shell (almost no visible text for its size, like
+``<div id="root"></div>`` plus a bundle), or a fetch refused with a bot
+wall or rate limit status (BLOCKED_STATUSES), escalates to the next tier:
+plain requests, then a local Playwright render, then ScrapingBee. The
+outcome of each tier is remembered per host in a small SQLite table, so
+later fetches of that host (in this run or the next) skip the tiers that
+failed there: a single-page app goes straight to the browser, and a site
+that blocks headless browsers straight to ScrapingBee.
+
+Errors that are the site's rather than the tier's (a host that doesn't
+resolve, a 404, a page over the size limit) end the fetch: another tier
+would fail the same way at a higher price, so they are not escalated or
+recorded. Failures are only remembered for a while (SHELL_TTL,
+ERROR_TTL), so a site that starts rendering on the server, or stops
+blocking, is tried with the cheap tier again.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import html_extract
+import metrics
+from http_client import ResponseTooLarge
+
+DEFAULT_ROUTES_PATH = os.getenv("FETCH_ROUTES_PATH", ".fetch_routes.sqlite3")
+TIERS = ('requests', 'playwright', 'scrapingbee')  # cheapest first
+
+OK, SHELL, ERROR = 'ok', 'shell', 'error'
+DAY = 24 * 60 * 60
+SHELL_TTL = 30 * DAY        # how long a tier that returned a JS shell is skipped for its host
+ERROR_TTL = 1 * DAY         # ... and one that failed outright
+OK_REFRESH = 1 * DAY        # successes are rewritten at most this often
+
+# A page is a JS shell if its body text (leaving out <title> and <noscript>
+# notices) is shorter than MIN_TEXT_CHARS, or shorter than SHELL_MAX_TEXT
+# and under MIN_TEXT_RATIO of the markup.
+MIN_TEXT_CHARS = 200
+SHELL_MAX_TEXT = 1500
+MIN_TEXT_RATIO = 0.01
+SHELL_SKIPPED_TAGS = html_extract.SKIPPED_TAGS | {'noscript', 'title'}
+
+BLOCKED_STATUSES = {403, 429, 503}  # bot walls and rate limits another tier may get past
+UNRESOLVED_HOST = ('NameResolutionError', 'Name or service not known', 'nodename nor servname',
+                   'getaddrinfo failed', 'ERR_NAME_NOT_RESOLVED')
+
+
+def host_key(url):
+    """Lowercased host (and port) of ``url`` without a leading "www."."""
+    host = urlparse(str(url)).netloc.lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def text_chars(page):
+    """Characters of block text in a ``(blocks, dropped, about_href)`` page."""
+    return sum(len(text) for text, _, _ in page[0]) if page else 0
+
+
+def is_js_shell(markup, encoding=None):
+    """True if ``markup`` has too little body text to be what a browser would show.
+
+    Measured on the raw text rather than the chrome-filtered blocks, so
+    navigation and footers of a short but real page count towards it.
+    """
+    text = html_extract.visible_text(markup, limit=SHELL_MAX_TEXT, encoding=encoding, skipped=SHELL_SKIPPED_TAGS)
+    if len(text) < MIN_TEXT_CHARS:
+        return True
+    return len(text) < SHELL_MAX_TEXT and len(text) < MIN_TEXT_RATIO * len(markup)
+
+
+def tier_failed(tier, error):
+    """True if ``error`` from ``tier`` is the tier's failure, not the site's, so the next tier may do better.
+
+    Bot walls and rate limits are; other HTTP errors, oversized pages,
+    unresolvable hosts, and timeouts or connection errors of a plain
+    request are the site's. A browser or ScrapingBee failing otherwise is
+    the tier's.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is not None:
+        return status in BLOCKED_STATUSES
+    if tier == TIERS[0] or isinstance(error, ResponseTooLarge):
+        return False
+    message = f"{type(error).__name__}: {error}"
+    return not any(marker in message for marker in UNRESOLVED_HOST)
+
+
+class FetchRouter:
+    """SQLite table of (host, tier) -> last outcome and when. Safe to share between threads."""
+
+    def __init__(self, path=DEFAULT_ROUTES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            " host TEXT NOT NULL, tier TEXT NOT NULL, outcome TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (host, tier)) WITHOUT ROWID"
+        )
+
+    def outcomes(self, host):
+        """``{tier: (outcome, updated_at)}`` recorded for ``host``."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT tier, outcome, updated_at FROM routes WHERE host = ?", (host,)
+            ).fetchall()
+        return {tier: (outcome, updated_at) for tier, outcome, updated_at in rows}
+
+    def plan(self, host, tiers):
+        """``tiers`` in order, minus those that failed recently for ``host``.
+
+        If every tier failed recently, only the cheapest is tried, so a dead
+        site doesn't spend browser time and ScrapingBee credits on every run.
+        """
+        outcomes = self.outcomes(host)
+        now = time.time()
+        usable = [tier for tier in tiers if not _failed_recently(outcomes.get(tier), now)]
+        skipped = len(tiers) - len(usable)
+        if skipped:
+            metrics.count('fetch_route_skips', skipped)
+        return usable or list(tiers[:1])
+
+    def record(self, host, tier, outcome):
+        now = time.time()
+        with self._lock:
+            # Failures always update; a success only if it changes the route or is getting old.
+            self._conn.execute(
+                "INSERT INTO routes (host, tier, outcome, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (host, tier) DO UPDATE SET outcome = excluded.outcome, updated_at = excluded.updated_at"
+                " WHERE excluded.outcome != ? OR routes.outcome != ? OR routes.updated_at < ?",
+                (host, tier, outcome, now, OK, OK, now - OK_REFRESH)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _failed_recently(outcome, now):
+    if outcome is None or outcome[0] == OK:
+        return False
+    return now - outcome[1] < (SHELL_TTL if outcome[0] == SHELL else ERROR_TTL)
+
+
+def _richer(best, page):
+    return page if page is not None and text_chars(page) > text_chars(best) else best
+
+
+def fetch(url, fetchers, parse):
+    """Content blocks of ``url`` from the cheapest tier that returns a real page.
+
+    ``fetchers`` maps tier names, cheapest first, to functions returning
+    ``(html, encoding)`` (raising if the fetch failed); ``parse(html, encoding)``
+    turns that into the ``(blocks, dropped, about_href)`` of
+    ``html_extract.text_blocks``. If no tier returns more than a shell, the
+    page with the most text is returned (or None if no tier returned one).
+    """
+    router = get_router()
+    host = host_key(url)
+    best = None
+    for i, tier in enumerate(router.plan(host, _enabled(fetchers))):
+        if i:
+            metrics.count('fallbacks', kind=tier)
+        try:
+            html, encoding = fetchers[tier](url)
+        except Exception as e:
+            if not _failed(router, host, tier, url, e):
+                break
+            continue
+        page = parse(html, encoding)
+        if not is_js_shell(html, encoding):
+            _record(router, host, tier, OK)
+            return page
+        _record(router, host, tier, SHELL)
+        best = _richer(best, page)
+    return best
+
+
+async def fetch_async(url, fetchers, parse):
+    """``fetch`` with coroutine ``fetchers`` and ``parse``."""
+    router = get_router()
+    host = host_key(url)
+    best = None
+    for i, tier in enumerate(router.plan(host, _enabled(fetchers))):
+        if i:
+            metrics.count('fallbacks', kind=tier)
+        try:
+            html, encoding = await fetchers[tier](url)
+        except Exception as e:
+            if not _failed(router, host, tier, url, e):
+                break
+            continue
+        page = await parse(html, encoding)
+        if not is_js_shell(html, encoding):
+            _record(router, host, tier, OK)
+            return page
+        _record(router, host, tier, SHELL)
+        best = _richer(best, page)
+    return best
+
+
+def _failed(router, host, tier, url, error):
+    """Log a failed fetch and record it if it was the tier's; True if the next tier should be tried."""
+    logging.warning(f"{tier} fetch failed for {url}: {error}")
+    if not tier_failed(tier, error):
+        metrics.count('fetch_tier', tier=tier, outcome='unavailable')
+        return False
+    _record(router, host, tier, ERROR)
+    return True
+
+
+def _record(router, host, tier, outcome):
+    metrics.count('fetch_tier', tier=tier, outcome=outcome)
+    try:
+        router.record(host, tier, outcome)
+    except sqlite3.Error as e:
+        logging.warning(f"Fetch route for {host} not saved: {e}")
+
+
+_router = None
+_settings = {'path': DEFAULT_ROUTES_PATH, 'tiers': TIERS}
+_router_lock = threading.Lock()
+
+
+def parse_tiers(spec):
+    """Parse a CLI list like ``requests,scrapingbee`` into tier names."""
+    tiers = tuple(tier.strip() for tier in spec.split(',') if tier.strip())
+    unknown = [tier for tier in tiers if tier not in TIERS]
+    if unknown or not tiers:
+        raise ValueError(f"Invalid fetch tiers {spec!r}, expected a comma-separated subset of {', '.join(TIERS)}")
+    return tiers
+
+
+def configure(path=None, tiers=None):
+    """Set the routes file and which tiers may be used (always tried cheapest first)."""
+    global _router
+    with _router_lock:
+        if tiers is not None:
+            _settings['tiers'] = tuple(tiers)
+        if path is not None and path != _settings['path']:
+            _settings['path'] = path
+            if _router is not None:
+                _router.close()
+                _router = None
+
+
+def _enabled(fetchers):
+    return [tier for tier in TIERS if tier in fetchers and tier in _settings['tiers']]
+
+
+def get_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = FetchRouter(_settings['path'])
+        return _router
@@ -0,0 +1,365 @@
+"""Single-pass HTML text extraction shared by the scraper and the LLM prompt builder.
+
+Visible text is collected by a streaming parser that stops as soon as the
+character budget is filled, and Wikipedia infoboxes are parsed from just the
+infobox table instead of the whole article. ``text_blocks`` splits a page
+into block-level text runs for content selection. lxml is used when
+installed, otherwise the standard library parser.
+"""
+import re
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # pragma: no cover - optional speedup
+    etree = None
+
+TEXT_LIMIT = 6000
+CHUNK_SIZE = 16 * 1024
+
+# Elements whose contents BeautifulSoup leaves out of stripped_strings / get_text.
+SKIPPED_TAGS = {'script', 'style', 'template'}
+
+BACKEND = 'lxml' if etree is not None else 'html.parser'
+
+# text_blocks: elements that start a new block, page chrome whose text is dropped,
+# and whole class/id tokens marking chrome (cookie banners, menus, footers).
+BLOCK_TAGS = {
+    'p', 'div', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'section', 'article', 'main', 'aside', 'header',
+    'footer', 'nav', 'table', 'tr', 'td', 'th', 'blockquote', 'figcaption', 'form', 'br', 'hr',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'title', 'button', 'option',
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'title'}
+CHROME_TAGS = {'nav', 'header', 'footer', 'aside', 'form', 'noscript', 'svg', 'select', 'button', 'dialog'}
+CHROME_TOKENS = {
+    'nav', 'navbar', 'navigation', 'menu', 'main-menu', 'nav-menu', 'mega-menu', 'site-nav', 'site-navigation',
+    'footer', 'site-footer', 'page-footer', 'breadcrumb', 'breadcrumbs', 'social', 'social-links',
+    'social-icons', 'share', 'share-buttons', 'sharing', 'newsletter', 'subscribe', 'popup', 'modal',
+    'sidebar', 'skip-link', 'language-switcher', 'language-selector', 'lang-switcher', 'signup', 'login',
+}
+CHROME_PREFIXES = ('cookie', 'consent', 'gdpr', 'onetrust')  # cookie-notice, consent-modal, ...
+# Containers of the page's content whatever their class says (<body class="no-sidebar">).
+CONTENT_TAGS = {'html', 'body', 'main', 'article'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param',
+             'source', 'track', 'wbr'}
+ABOUT_LINK_TEXT = {'about', 'about us', 'who we are', 'our story', 'company', 'our company'}
+BLOCK_TEXT_LIMIT = 100000
+
+_TABLE_TAG = re.compile(r'<(/?)table\b[^>]*>', re.IGNORECASE)
+_CLASS_ATTR = re.compile(r'''\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+
+
+class _TextCollector:
+    """Parser target that gathers stripped text runs outside ``skipped`` tags (script/style/template)."""
+
+    def __init__(self, limit, skipped=SKIPPED_TAGS):
+        self.limit = limit
+        self.skipped = skipped
+        self.parts = []
+        self.length = 0
+        self.skip_depth = 0
+        self._pending = []
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def _flush(self):
+        if self._pending:
+            text = ''.join(self._pending).strip()
+            self._pending = []
+            if text:
+                self.parts.append(text)
+                self.length += len(text) + 1
+
+    def start(self, tag, attrs=None):
+        self._flush()
+        if tag.lower() in self.skipped:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        self._flush()
+        if tag.lower() in self.skipped and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, text):
+        if not self.skip_depth:
+            self._pending.append(text)
+
+    def comment(self, text):
+        self._flush()
+
+    def close(self):
+        self._flush()
+        return ' '.join(self.parts)[:self.limit]
+
+
+class _StdlibTextParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag)
+        self.collector.end(tag)
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+    def handle_comment(self, data):
+        self.collector.comment(data)
+
+
+def _make_parser(collector, backend):
+    if backend == 'lxml':
+        return etree.HTMLParser(target=collector)
+    return _StdlibTextParser(collector)
+
+
+def _chrome_attrs(attrs):
+    """True if a class or id token marks the element as page chrome ("hero-banner" doesn't)."""
+    tokens = f"{attrs.get('class') or ''} {attrs.get('id') or ''}".lower().split()
+    return any(token in CHROME_TOKENS or token.startswith(CHROME_PREFIXES) for token in tokens)
+
+
+class _BlockCollector:
+    """Parser target splitting visible text into ``(text, is_heading, link_ratio)`` blocks.
+
+    Text inside page chrome (nav, header, footer, cookie banners...) is
+    dropped and counted, unless that would leave no page text besides the
+    title, in which case every block is kept. Meta descriptions become
+    heading blocks of their own and the first "About" link is remembered.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.blocks = []
+        self.length = 0
+        self.dropped = 0
+        self.about_href = None
+        self._stack = []          # (tag, is_chrome)
+        self._chrome_depth = 0
+        self._chrome_blocks = []  # (position in blocks, block), in case nothing else is left
+        self._chrome_length = 0
+        self._page_length = 0     # kept text outside <title>
+        self._title_depth = 0
+        self._skip_depth = 0
+        self._heading_depth = 0
+        self._link_depth = 0
+        self._link_href = None
+        self._link_text = []
+        self._text = []
+        self._link_chars = 0
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def _flush(self):
+        text = ' '.join(''.join(self._text).split())
+        if text:
+            block = (text, bool(self._heading_depth), round(min(1.0, self._link_chars / len(text)), 2))
+            if self._chrome_depth:
+                self.dropped += 1
+                if self._chrome_length < self.limit:
+                    self._chrome_blocks.append((len(self.blocks), block))
+                    self._chrome_length += len(text)
+            else:
+                self.blocks.append(block)
+                self.length += len(text)
+                if not self._title_depth:
+                    self._page_length += len(text)
+        self._text = []
+        self._link_chars = 0
+
+    def start(self, tag, attrs=None):
+        tag = tag.lower()
+        attrs = dict(attrs or {})
+        if tag == 'meta':
+            name = (attrs.get('name') or attrs.get('property') or '').lower()
+            if name in ('description', 'og:description') and attrs.get('content'):
+                text = ' '.join(attrs['content'].split())
+                if text and all(text != block[0] for block in self.blocks):
+                    self.blocks.append((text, True, 0.0))
+            return
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag == 'a':
+            self._link_depth += 1
+            self._link_href = attrs.get('href')
+            self._link_text = []
+        if tag in VOID_TAGS:
+            return
+        chrome = tag in CHROME_TAGS or (tag not in CONTENT_TAGS and _chrome_attrs(attrs))
+        self._stack.append((tag, chrome))
+        self._chrome_depth += chrome
+        self._heading_depth += tag in HEADING_TAGS
+        self._title_depth += tag == 'title'
+
+    def end(self, tag):
+        tag = tag.lower()
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        if tag == 'a' and self._link_depth:
+            self._link_depth -= 1
+            label = ' '.join(''.join(self._link_text).split()).lower()
+            href = self._link_href or ''
+            if self.about_href is None and href and (label in ABOUT_LINK_TEXT or '/about' in href.lower()):
+                self.about_href = href
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in VOID_TAGS or all(open_tag != tag for open_tag, _ in self._stack):
+            return
+        # Close everything up to the matching start tag (browsers auto-close unclosed children).
+        while self._stack:
+            open_tag, chrome = self._stack.pop()
+            self._chrome_depth -= chrome
+            self._heading_depth -= open_tag in HEADING_TAGS
+            self._title_depth -= open_tag == 'title'
+            if open_tag == tag:
+                break
+
+    def data(self, text):
+        if self._skip_depth:
+            return
+        self._text.append(text)
+        if self._link_depth:
+            self._link_chars += len(text.strip())
+            self._link_text.append(text)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        self._flush()
+        if not self._page_length and self._chrome_blocks:
+            # Everything but the title looked like chrome: better the unfiltered page than none.
+            blocks, start = [], 0
+            for position, block in self._chrome_blocks:
+                blocks += self.blocks[start:position]
+                blocks.append(block)
+                start = position
+            self.blocks = blocks + self.blocks[start:]
+            self.dropped = 0
+        return self.blocks
+
+
+class _StdlibBlockParser(_StdlibTextParser):
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.collector.start(tag, attrs)
+        self.collector.end(tag)
+
+
+def text_blocks(html, encoding=None, limit=BLOCK_TEXT_LIMIT, backend=None):
+    """Split a page into content blocks for prompt building.
+
+    Returns ``(blocks, dropped, about_href)``: blocks are
+    ``(text, is_heading, link_ratio)`` in document order, ``dropped`` counts
+    blocks removed as page chrome and ``about_href`` is the first link that
+    looks like the site's About page (or None). Parsing stops after
+    ``limit`` characters of block text.
+    """
+    if not html:
+        return [], 0, None
+    html = _decode(html, encoding)
+    collector = _BlockCollector(limit)
+    if (backend or BACKEND) == 'lxml':
+        parser = etree.HTMLParser(target=collector)
+    else:
+        parser = _StdlibBlockParser(collector)
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if collector.full:
+            break
+    collector.close()
+    return collector.blocks, collector.dropped, collector.about_href
+
+
+def _decode(html, encoding):
+    if isinstance(html, bytes):
+        return html.decode(encoding or 'utf-8', errors='replace')
+    return html
+
+
+def visible_text(html, limit=TEXT_LIMIT, backend=None, encoding=None, skipped=SKIPPED_TAGS):
+    """Equivalent of ``' '.join(soup.stripped_strings)[:limit]`` after dropping scripts and styles.
+
+    The document is fed to the parser in chunks and parsing stops once
+    ``limit`` characters of text have been collected. Bytes are decoded
+    with ``encoding`` (e.g. ``response.encoding``), defaulting to UTF-8.
+    The text of ``skipped`` tags is left out.
+    """
+    if not html:
+        return ""
+    html = _decode(html, encoding)
+    collector = _TextCollector(limit, skipped)
+    parser = _make_parser(collector, backend or BACKEND)
+    for start in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[start:start + CHUNK_SIZE])
+        if collector.full:
+            break
+    return collector.close()
+
+
+def _has_class(tag_html, name):
+    match = _CLASS_ATTR.search(tag_html)
+    if not match:
+        return False
+    value = next(group for group in match.groups() if group is not None)
+    return name in value.split()
+
+
+def find_table_html(html, class_name):
+    """Return the markup of the first <table> carrying ``class_name``, or None.
+
+    Located with a regex scan and nested-table depth counting, so the rest
+    of the document is never parsed.
+    """
+    start = None
+    depth = 0
+    for match in _TABLE_TAG.finditer(html):
+        closing = match.group(1) == '/'
+        if start is None:
+            if not closing and _has_class(match.group(0), class_name):
+                start = match.start()
+                depth = 1
+            continue
+        depth += -1 if closing else 1
+        if depth == 0:
+            return html[start:match.end()]
+    return html[start:] if start is not None else None
+
+
+def infobox_rows(html, encoding=None):
+    """Yield ``(header_text, data_text, first_link_href)`` for each row of a Wikipedia infobox.
+
+    Mirrors ``soup.find('table', {'class': 'infobox'})`` followed by
+    ``row.find('th')`` / ``row.find('td')`` for every ``tr`` in it.
+    """
+    html = _decode(html, encoding)
+    table_html = find_table_html(html, 'infobox')
+    if table_html is None:
+        return
+    from bs4 import BeautifulSoup  # only the infobox fallback needs it; importing it is slow
+    infobox = BeautifulSoup(table_html, 'lxml' if etree is not None else 'html.parser').find('table')
+    if infobox is None:
+        return
+    for row in infobox.find_all('tr'):
+        header = row.find('th')
+        data = row.find('td')
+        if not header or not data:
+            continue
+        link = data.find('a')
+        href = link['href'] if link and link.has_attr('href') else None
+        yield header.text, data.text, href
@@ -0,0 +1,160 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+import metrics
+import rate_limiter
+
+POOL_CONNECTIONS = 64          # distinct hosts kept in the connection pool
+POOL_MAXSIZE = 16              # keep-alive connections per host
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 60
+
+
+class ResponseTooLarge(requests.RequestException):
+    """The response body exceeded the client's size limit."""
+
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None."""
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpClient:
+    """Shared HTTP client: pooled keep-alive connections, compression, per-host limits and retries.
+
+    Every thread gets its own ``requests.Session`` but all sessions mount the
+    same ``HTTPAdapter``, so connections are reused across threads without
+    sharing session state. Request rate and concurrency per host are
+    enforced by the rate_limiter scheduler, which also hears about 429s.
+    """
+
+    def __init__(self, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                 max_bytes=MAX_RESPONSE_BYTES, retries=3, backoff=1.0):
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   pool_block=False, max_retries=0)
+        self.max_bytes = max_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            self._local.session = session
+        return session
+
+    def backoff_delay(self, attempt, response=None):
+        """Exponential backoff with full jitter, overridden by the server's Retry-After."""
+        retry_after = retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, MAX_BACKOFF)
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    def get(self, url, params=None, headers=None, timeout=10, retries=None, max_bytes=None):
+        """GET ``url`` and return a ``requests.Response`` whose body is already read.
+
+        Connection errors, timeouts and 429/5xx responses are retried; other
+        HTTP errors raise immediately. Bodies over ``max_bytes`` raise
+        ResponseTooLarge.
+        """
+        retries = retries or self.retries
+        service = rate_limiter.service_for_host(urlparse(url).netloc)
+        label = rate_limiter.service_label(service)
+        for attempt in range(retries):
+            response = None
+            try:
+                with rate_limiter.slot(service) as limiter, metrics.span('http_request', service=label):
+                    response = self._get_once(url, params, headers, timeout, max_bytes or self.max_bytes)
+                if response.status_code == 429:
+                    limiter.throttled(retry_after_seconds(response))
+                elif response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    limiter.succeeded()
+                    return response
+                error = requests.HTTPError(f"{response.status_code} for url: {response.url}", response=response)
+            except (ResponseTooLarge, requests.HTTPError):
+                raise
+            except requests.RequestException as e:
+                error = e
+
+            if attempt == retries - 1:
+                logging.error(f"Request failed after {retries} attempts: {error}")
+                raise error
+            delay = self.backoff_delay(attempt, response)
+            metrics.count('http_retries', service=label,
+                          reason=str(response.status_code) if response is not None else type(error).__name__)
+            logging.warning(f"Request failed ({error}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    def head(self, url, timeout=5):
+        """HEAD ``url`` once, following redirects; a cheap existence check, so nothing is retried."""
+        service = rate_limiter.service_for_host(urlparse(url).netloc)
+        label = rate_limiter.service_label(service)
+        with rate_limiter.slot(service) as limiter, metrics.span('http_request', service=label):
+            response = self.session.head(url, timeout=timeout, allow_redirects=True)
+        if response.status_code == 429:
+            limiter.throttled(retry_after_seconds(response))
+        else:
+            limiter.succeeded()
+        return response
+
+    def _get_once(self, url, params, headers, timeout, max_bytes):
+        response = self.session.get(url, params=params, headers=headers, timeout=timeout, stream=True)
+        try:
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ResponseTooLarge(f"{url} declares {declared} bytes (limit {max_bytes})")
+            body = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                body.extend(chunk)
+                if len(body) > max_bytes:
+                    raise ResponseTooLarge(f"{url} exceeded {max_bytes} bytes")
+            response._content = bytes(body)
+        finally:
+            response.close()
+        return response
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide HttpClient."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_client().head(url, **kwargs)
@@ -1,116 +1,221 @@
-import requests
-from bs4 import BeautifulSoup
-import google.generativeai as genai
-import re
+import http_client
+import html_extract
+import content_select
+import metrics
+import parse_pool
 import json
 import os
-from urllib.parse import urlparse
+import random
+import threading
+import time
 from dotenv import load_dotenv
+from cache import cached
+from content_select import estimate_tokens
+import browser_pool
+import fetch_router
+import rate_limiter
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SCRAPINGBEE_API_KEY = os.getenv("SCRAPINGBEE_API_KEY")
+SCRAPINGBEE_API_URL = os.getenv("SCRAPINGBEE_API_URL", "https://app.scrapingbee.com/api/v1/")
 
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY is not set in environment variables.")
-genai.configure(api_key=GEMINI_API_KEY)
+_genai = None
+_genai_lock = threading.Lock()
 
-def extract_visible_text_requests(url):
+def gemini():
+    """The google.generativeai module, imported and configured with GEMINI_API_KEY on first use.
+
+    Importing it takes most of a second, so startup, cache hits and rows
+    that never reach Gemini don't pay for it (or need the key).
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY is not set in environment variables.")
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+        return _genai
+
+def parse_blocks(html, encoding=None):
+    with metrics.span('parse', step='content_blocks'):
+        return parse_pool.run(html_extract.text_blocks, html, encoding=encoding)
+
+def fetch_requests(url):
+    """``(html, encoding)`` of a plain HTTP fetch; raises if it failed."""
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    with metrics.span('fetch', method='requests'):
+        response = http_client.get(url, timeout=10, headers=headers)
+    return response.content, response.encoding
+
+def fetch_scrapingbee(url):
+    print(f"🔁 Using ScrapingBee for {url}")
+    params = {
+        "api_key": SCRAPINGBEE_API_KEY,
+        "url": url,
+        "render_js": "true"
+    }
+    with metrics.span('fetch', method='scrapingbee'):
+        response = http_client.get(SCRAPINGBEE_API_URL, params=params, timeout=30)
+    return response.content, response.encoding
+
+def fetch_playwright(url):
+    with metrics.span('fetch', method='playwright'):
+        return browser_pool.get_pool().render(url), None
+
+def use_playwright():
+    # Use Playwright locally if installed and not on Streamlit Cloud
+    return "streamlit.app" not in os.environ.get("STREAMLIT_SERVER_URL", "")
+
+def fetchers():
+    """Fetch functions of the tiers available here, for ``fetch_router``."""
+    tiers = {'requests': fetch_requests}
+    if use_playwright():
+        tiers['playwright'] = fetch_playwright
+    if SCRAPINGBEE_API_KEY:
+        tiers['scrapingbee'] = fetch_scrapingbee
+    return tiers
+
+def page_blocks_requests(url):
+    """``(blocks, dropped, about_href)`` of a plain HTTP fetch, or None if the fetch failed."""
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, timeout=10, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-        return ' '.join(soup.stripped_strings)[:6000]
+        return parse_blocks(*fetch_requests(url))
     except Exception as e:
         print(f"⚠️ Requests failed for {url}: {e}")
-        return ""
+        return None
 
-def extract_visible_text_scrapingbee(url):
-    try:
-        print(f"🔁 Using ScrapingBee for {url}")
-        api_url = "https://app.scrapingbee.com/api/v1/"
-        params = {
-            "api_key": SCRAPINGBEE_API_KEY,
-            "url": url,
-            "render_js": "true"
-        }
-        response = requests.get(api_url, params=params, timeout=30)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-        return ' '.join(soup.stripped_strings)[:6000]
-    except Exception as e:
-        print(f"⚠️ ScrapingBee failed for {url}: {e}")
-        return ""
+def page_blocks(url):
+    """Content blocks of ``url`` from the cheapest tier that renders it, learned per domain by ``fetch_router``."""
+    return fetch_router.fetch(url, fetchers(), parse_blocks)
 
-def extract_visible_text_playwright(url):
-    try:
-        from playwright.sync_api import sync_playwright
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(
-                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                           "(KHTML, like Gecko) Chrome/115.0 Safari/537.36",
-                java_script_enabled=True,
-                viewport={"width": 1280, "height": 720},
-            )
-            page = context.new_page()
-            page.goto(url, wait_until="load", timeout=60000)
-            page.wait_for_timeout(15000)
-            html = page.content()
-            browser.close()
-        soup = BeautifulSoup(html, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-        return ' '.join(soup.stripped_strings)[:6000]
-    except Exception as e:
-        print(f"⚠️ Playwright failed for {url}: {e}")
+@cached('text', key=lambda url: f"{url}|{content_select.settings_key()}", store_if=bool)
+@metrics.timed('website_text')
+def extract_visible_text(url):
+    """Website text for the prompt: the most business-relevant blocks of the page (and of its
+    About page, when enabled) that fit the content token budget."""
+    page = page_blocks(url)
+    if not page or not page[0]:
         return ""
+    blocks, dropped, about_href = page
+    about_blocks = ()
+    if content_select.about_page_enabled():
+        about = page_blocks_requests(content_select.about_url(url, about_href))
+        if about:
+            about_blocks = about[0]
+            dropped += about[1]
+    text, repeated = content_select.select(blocks, about_blocks)
+    metrics.count('boilerplate_blocks', dropped + repeated)
+    metrics.distribution('content_tokens', estimate_tokens(text))
+    return text
 
-def extract_visible_text(url):
-    js_heavy_sites = ["openai.com", "example-js-site.com"]
-    parsed = urlparse(url)
-    hostname = parsed.netloc.lower()
+_json_decoder = json.JSONDecoder()
 
-    # Use Playwright locally if installed and not on Streamlit Cloud
-    use_playwright = "streamlit.app" not in os.environ.get("STREAMLIT_SERVER_URL", "")
-
-    if any(site in hostname for site in js_heavy_sites):
-        if use_playwright:
-            text = extract_visible_text_playwright(url)
-            if text:
-                return text
-            print("🧭 Falling back to ScrapingBee...")
-        return extract_visible_text_scrapingbee(url)
-
-    # Fast path for simple sites
-    text = extract_visible_text_requests(url)
-    if not text and any(site in hostname for site in js_heavy_sites):
-        return extract_visible_text_scrapingbee(url)
-    return text
+def iter_json_values(text):
+    """Every complete top-level JSON object or array embedded in ``text``, in order.
 
-def extract_json_from_text(text):
-    json_match = re.search(r'\{.*?\}', text, re.DOTALL)
-    if json_match:
+    Prose, code fences and braces inside strings are handled by decoding
+    from each candidate '{' or '[' with the real JSON parser; when a value
+    doesn't decode (e.g. a truncated array) the scan moves into it, so its
+    complete elements are still found.
+    """
+    pos = 0
+    while True:
+        starts = [i for i in (text.find('{', pos), text.find('[', pos)) if i >= 0]
+        if not starts:
+            return
+        start = min(starts)
         try:
-            return json.loads(json_match.group())
+            value, pos = _json_decoder.raw_decode(text, start)
         except json.JSONDecodeError:
-            pass
-    return None
-
-def analyze_company_website(url, company_name):
-    content = extract_visible_text(url)
-    if not content:
-        return "N/A", "N/A", "N/A"
+            pos = start + 1
+            continue
+        yield value
 
+def _partial_object(text):
+    """Members of the first JSON object in ``text`` decoded up to where it breaks off (e.g. a truncated reply)."""
+    start = text.find('{')
+    data = {}
+    if start < 0:
+        return data
+    pos = start + 1
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
-        prompt = f"""
+        while True:
+            while text[pos] in ' \t\r\n,':
+                pos += 1
+            key, pos = _json_decoder.raw_decode(text, pos)
+            while text[pos] in ' \t\r\n':
+                pos += 1
+            if not isinstance(key, str) or text[pos] != ':':
+                return data
+            pos += 1
+            while text[pos] in ' \t\r\n':
+                pos += 1
+            data[key], pos = _json_decoder.raw_decode(text, pos)
+    except (IndexError, json.JSONDecodeError):
+        return data
+
+def extract_json_from_text(text):
+    """First JSON object in a model reply, or the members salvaged from a truncated one (None if none)."""
+    for value in iter_json_values(text):
+        if isinstance(value, dict):
+            return value
+    return _partial_object(text) or None
+
+MODEL_NAME = "gemini-1.5-flash-latest"
+
+ANALYSIS_EXAMPLE = """{
+  "summary": "OpenAI develops cutting-edge artificial intelligence models and tools.",
+  "target_customer": "Businesses and developers who need advanced AI capabilities.",
+  "ai_automation_idea": "Offer customized AI model fine-tuning services to improve client-specific workflows."
+}"""
+
+ANALYSIS_FIELDS = ("summary", "target_customer", "ai_automation_idea")
+
+# Constrain replies to JSON of exactly these shapes (the prompt's example stays as a hint).
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": "string"} for field in ANALYSIS_FIELDS},
+    "required": list(ANALYSIS_FIELDS),
+}
+BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": dict(id={"type": "integer"}, company_name={"type": "string"},
+                           **ANALYSIS_SCHEMA["properties"]),
+        "required": ["id", "company_name", *ANALYSIS_FIELDS],
+    },
+}
+
+# Batched mode: one request carries several companies, up to this many (estimated) prompt tokens.
+DEFAULT_BATCH_TOKEN_BUDGET = 24000
+MAX_BATCH_COMPANIES = 20
+
+# Rate-limited and transient API errors are retried with backoff; a malformed reply is re-asked once.
+GEMINI_ATTEMPTS = 4
+GEMINI_BACKOFF = 2.0
+MAX_GEMINI_BACKOFF = 60
+MALFORMED_REASKS = 1
+# Analyses missing a field (e.g. a reply still malformed after the re-ask) are cached this
+# long instead of the analysis layer's full TTL, so they are asked again soon.
+PARTIAL_ANALYSIS_TTL = 24 * 60 * 60
+REASK_NOTE = "\nYour previous reply was not valid JSON with all the keys above. Reply with the JSON only.\n"
+
+class MalformedResponse(ValueError):
+    """The model answered, but not with usable JSON (or the answer was blocked)."""
+
+def json_model(schema):
+    """Gemini model whose replies are constrained to JSON matching ``schema``."""
+    return gemini().GenerativeModel(MODEL_NAME, generation_config={
+        "response_mime_type": "application/json",
+        "response_schema": schema,
+    })
+
+def build_analysis_prompt(company_name, content):
+    return f"""
 You are an expert business analyst.
 
 Analyze the company's website text below. Provide your answers strictly as JSON with keys: "summary", "target_customer", and "ai_automation_idea".
@@ -121,24 +226,243 @@ Website Text:
 {content}
 
 Output JSON exactly like this example:
-{{
-  "summary": "OpenAI develops cutting-edge artificial intelligence models and tools.",
-  "target_customer": "Businesses and developers who need advanced AI capabilities.",
-  "ai_automation_idea": "Offer customized AI model fine-tuning services to improve client-specific workflows."
-}}
+{ANALYSIS_EXAMPLE}
 """
-        response = model.generate_content(prompt)
-        result = response.text.strip()
-        data = extract_json_from_text(result)
-        if not data:
-            print("⚠️ Failed to parse JSON from model response.")
-            return "N/A", "N/A", "N/A"
-
-        summary = data.get("summary", "N/A")
-        target_customer = data.get("target_customer", "N/A")
-        ai_automation_idea = data.get("ai_automation_idea", "N/A")
-        return summary, target_customer, ai_automation_idea
+
+def is_rate_limit_error(error):
+    from google.api_core import exceptions as google_exceptions
+    return isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests))
+
+def classify_error(error):
+    """'rate_limit' and 'transient' errors are worth retrying; 'malformed' replies a re-ask; 'fatal' nothing."""
+    from google.api_core import exceptions as google_exceptions
+    if is_rate_limit_error(error):
+        return 'rate_limit'
+    if isinstance(error, (google_exceptions.InternalServerError, google_exceptions.ServiceUnavailable,
+                          google_exceptions.DeadlineExceeded, google_exceptions.GatewayTimeout,
+                          ConnectionError, TimeoutError)):
+        return 'transient'
+    if isinstance(error, MalformedResponse):
+        return 'malformed'
+    return 'fatal'
+
+def generate(model, prompt):
+    """generate_content under the shared 'gemini' quota, reporting quota errors to the scheduler.
+
+    Rate-limit and transient server errors are retried with exponential
+    backoff (outside the quota slot); other errors are raised at once.
+    """
+    for attempt in range(GEMINI_ATTEMPTS):
+        with rate_limiter.slot('gemini') as limiter:
+            try:
+                with metrics.span('gemini'):
+                    response = model.generate_content(prompt)
+                break
+            except Exception as e:
+                error, reason = e, classify_error(e)
+                if reason == 'rate_limit':
+                    limiter.throttled()
+                if reason not in ('rate_limit', 'transient') or attempt == GEMINI_ATTEMPTS - 1:
+                    raise
+        time.sleep(retry_delay(attempt, reason, error))
+    limiter.succeeded()
+    record_usage(response, prompt)
+    return response
+
+def retry_delay(attempt, reason, error):
+    """Backoff before retry ``attempt + 1`` of a Gemini request (exponential with full jitter)."""
+    delay = random.uniform(0, min(MAX_GEMINI_BACKOFF, GEMINI_BACKOFF * 2 ** attempt))
+    metrics.count('gemini_retries', reason=reason)
+    print(f"🔁 Gemini {reason.replace('_', ' ')} ({error}), retrying in {delay:.1f}s...")
+    return delay
+
+def record_usage(response, prompt):
+    """Count one answered request and its prompt tokens (reported by the API, else estimated)."""
+    usage = getattr(response, 'usage_metadata', None)
+    tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+    metrics.count('gemini_requests')
+    metrics.count('gemini_prompt_tokens', tokens)
+    metrics.distribution('gemini_prompt_tokens', tokens)
+
+def response_text(response):
+    """Reply text, raising MalformedResponse when the model returned no text (e.g. a blocked answer)."""
+    try:
+        return response.text.strip()
+    except ValueError as e:
+        raise MalformedResponse(f"no text in response: {e}") from e
+
+def analysis_fields(data):
+    """(summary, target_customer, ai_automation_idea) with "N/A" for each missing or empty field."""
+    data = data if isinstance(data, dict) else {}
+    return tuple(v.strip() if isinstance(v, str) and v.strip() else "N/A"
+                 for v in (data.get(field) for field in ANALYSIS_FIELDS))
+
+def parse_analysis(response):
+    with metrics.span('parse', step='json'):
+        return analysis_fields(extract_json_from_text(response_text(response)))
+
+def completeness(result):
+    return sum(v != "N/A" for v in result)
+
+def analyze_content(content, company_name):
+    """Run a single Gemini analysis over already-extracted website text.
+
+    A reply that isn't JSON with all three fields is re-asked once; fields
+    that did parse are kept even if the re-ask fails too.
+    """
+    prompt = build_analysis_prompt(company_name, content)
+    best = ("N/A", "N/A", "N/A")
+    try:
+        model = json_model(ANALYSIS_SCHEMA)
+        for attempt in range(MALFORMED_REASKS + 1):
+            response = generate(model, prompt if attempt == 0 else prompt + REASK_NOTE)
+            result = parse_analysis(response)
+            if "N/A" not in result:
+                return result
+            best = max(best, result, key=completeness)
+            if attempt < MALFORMED_REASKS:
+                metrics.count('gemini_retries', reason='malformed')
+        print("⚠️ Failed to parse JSON from model response.")
+        metrics.count('gemini_failures', reason='malformed')
+        return best
 
     except Exception as e:
         print(f"⚠️ Gemini API error: {e}")
+        metrics.count('gemini_failures', reason=classify_error(e))
+        return best
+
+@cached(
+    'analysis',
+    key=lambda url, company_name: f"{url}|{company_name.strip().casefold()}",
+    store_if=lambda result: any(v != "N/A" for v in result),
+    ttl=lambda result: PARTIAL_ANALYSIS_TTL if "N/A" in result else None,
+    load=tuple
+)
+@metrics.timed('analyze_company_website')
+def analyze_company_website(url, company_name):
+    content = extract_visible_text(url)
+    if not content:
         return "N/A", "N/A", "N/A"
+    return analyze_content(content, company_name)
+
+def build_batch_prompt(items):
+    """Prompt for several (company_name, content) pairs, answered as one JSON array keyed by id."""
+    sections = []
+    for i, (company_name, content) in enumerate(items):
+        sections.append(f"""### id: {i}
+Company Name: "{company_name}"
+
+Website Text:
+{content}
+""")
+    companies = "\n".join(sections)
+    return f"""
+You are an expert business analyst.
+
+Analyze each company's website text below. Provide your answers strictly as a JSON array containing one object per company, with keys: "id", "company_name", "summary", "target_customer", and "ai_automation_idea". Copy "id" and "company_name" exactly as given.
+
+{companies}
+Each array element must look exactly like this example (with that company's id and name):
+{{"id": 0, "company_name": "OpenAI", {ANALYSIS_EXAMPLE[1:].strip()}
+"""
+
+BATCH_OVERHEAD_TOKENS = estimate_tokens(build_batch_prompt([]))
+
+def batch_item_tokens(company_name, content):
+    return estimate_tokens(company_name) + estimate_tokens(content) + 20
+
+def pack_batches(items, token_budget=DEFAULT_BATCH_TOKEN_BUDGET, max_companies=MAX_BATCH_COMPANIES):
+    """Split (company_name, content) items into lists of indices whose prompt fits token_budget."""
+    batch, used = [], BATCH_OVERHEAD_TOKENS
+    for i, (company_name, content) in enumerate(items):
+        cost = batch_item_tokens(company_name, content)
+        if batch and (used + cost > token_budget or len(batch) >= max_companies):
+            yield batch
+            batch, used = [], BATCH_OVERHEAD_TOKENS
+        batch.append(i)
+        used += cost
+    if batch:
+        yield batch
+
+def extract_json_array_from_text(text):
+    """First JSON array in a model reply; if it doesn't decode (e.g. truncated), its complete objects."""
+    objects = []
+    for value in iter_json_values(text):
+        if isinstance(value, list):
+            return value
+        if isinstance(value, dict):
+            objects.append(value)
+    return objects or None
+
+def _parse_batch_entry(entry, size):
+    """Return (id, result tuple) for a well-formed array element, else None."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        idx = int(entry.get("id"))
+    except (TypeError, ValueError):
+        return None
+    fields = [entry.get(key) for key in ANALYSIS_FIELDS]
+    if not 0 <= idx < size or not all(isinstance(v, str) and v.strip() for v in fields):
+        return None
+    return idx, tuple(fields)
+
+def _analyze_batch(items):
+    """One Gemini call for several companies; returns {index: result} for the entries that parsed.
+
+    API errors (after generate's own retries) are raised; a malformed reply gives {}.
+    """
+    response = generate(json_model(BATCH_SCHEMA), build_batch_prompt(items))
+    try:
+        with metrics.span('parse', step='json_array'):
+            data = extract_json_array_from_text(response_text(response))
+    except MalformedResponse:
+        data = None
+    if data is None:
+        print(f"⚠️ Failed to parse JSON array from batch response ({len(items)} companies).")
+        return {}
+
+    results = {}
+    for entry in data:
+        parsed = _parse_batch_entry(entry, len(items))
+        if parsed and parsed[0] not in results:
+            results[parsed[0]] = parsed[1]
+    return results
+
+def analyze_contents_batch(items, token_budget=DEFAULT_BATCH_TOKEN_BUDGET):
+    """Analyze many (company_name, content) pairs with as few Gemini calls as the budget allows.
+
+    Returns result tuples in input order. Companies missing from a batch
+    response, or returned malformed, are retried one by one. When the batch
+    request itself fails with a retryable error that outlasted its retries,
+    its companies get "N/A" instead of being re-sent one by one into the
+    same outage; other API errors (e.g. a rejected prompt) fall back to
+    single requests.
+    """
+    results = [None] * len(items)
+    for batch in pack_batches(items, token_budget):
+        if len(batch) == 1:
+            i = batch[0]
+            results[i] = analyze_content(items[i][1], items[i][0])
+            continue
+        try:
+            parsed = _analyze_batch([items[i] for i in batch])
+        except Exception as e:
+            reason = classify_error(e)
+            print(f"⚠️ Gemini API error (batch of {len(batch)}): {e}")
+            if reason in ('rate_limit', 'transient'):
+                metrics.count('gemini_failures', len(batch), reason=reason)
+                for i in batch:
+                    results[i] = ("N/A", "N/A", "N/A")
+                continue
+            parsed = {}
+        retries = [i for pos, i in enumerate(batch) if pos not in parsed]
+        if retries:
+            metrics.count('gemini_retries', len(retries), reason='batch_entry')
+            print(f"🔁 Retrying {len(retries)} of {len(batch)} companies individually")
+        for pos, i in enumerate(batch):
+            if pos in parsed:
+                results[i] = parsed[pos]
+            else:
+                results[i] = analyze_content(items[i][1], items[i][0])
+    return results
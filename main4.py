@@ -1,61 +1,236 @@
-import pandas as pd
-from scraper3 import get_company_details
-from llm3 import analyze_company_website
-
-# Load CSV
-df = pd.read_csv("sample_input.csv")
-
-# Add missing columns
-for col in ['Website', 'Industry', 'Company Size', 'HQ Location', 'Summary', 'Target Customer', 'AI Automation Idea']:
-    if col not in df.columns:
-        df[col] = 'N/A'
-
-websites, industries, sizes, locations = [], [], [], []
-summaries, customers, ideas = [], [], []
-
-for idx, row in df.iterrows():
-    company = row['company_name']
-    print(f"\n🔍 Fetching details for: {company}")
-
-    # Step 1: Scrape metadata
-    if (pd.isna(row['Website']) or row['Website'] == 'N/A' or
-        pd.isna(row['Industry']) or row['Industry'] == 'N/A' or
-        pd.isna(row['Company Size']) or row['Company Size'] == 'N/A' or
-        pd.isna(row['HQ Location']) or row['HQ Location'] == 'N/A'):
-        details = get_company_details(company)
-    else:
-        details = {
-            'Company Name': company,
-            'Website': row['Website'],
-            'Industry': row['Industry'],
-            'Company Size': row['Company Size'],
-            'HQ Location': row['HQ Location']
-        }
-
-    websites.append(details['Website'])
-    industries.append(details['Industry'])
-    sizes.append(details['Company Size'])
-    locations.append(details['HQ Location'])
-
-    # Step 2: Analyze using Gemini
-    if details['Website'] != 'N/A':
-        print(f"🤖 Running LLM analysis for: {details['Website']}")
-        summary, customer, idea = analyze_company_website(details['Website'], company)
-    else:
-        summary, customer, idea = "N/A", "N/A", "N/A"
-
-    summaries.append(summary)
-    customers.append(customer)
-    ideas.append(idea)
-
-# Update DataFrame
-df['Website'] = websites
-df['Industry'] = industries
-df['Company Size'] = sizes
-df['HQ Location'] = locations
-df['Summary'] = summaries
-df['Target Customer'] = customers
-df['AI Automation Idea'] = ideas
-
-df.to_csv("enriched_output2.csv", index=False)
-print("\n✅ Enrichment complete. Output saved to enriched_output.csv")
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+import cache
+import content_select
+import domain_index
+import entity_store
+import fetch_router
+import metrics
+import parse_pool
+import rate_limiter
+from llm3 import DEFAULT_BATCH_TOKEN_BUDGET
+from enrichment import (
+    enrich_dataframe, EnrichmentEngine, OUTPUT_COLUMNS, DEFAULT_LOOKUP_WORKERS, DEFAULT_ANALYSIS_WORKERS
+)
+
+CHECKPOINT_INTERVAL = 2.0  # seconds between checkpoint writes in streaming mode
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Enrich a CSV of company names with metadata and LLM analysis.")
+    parser.add_argument("--input", default="sample_input.csv", help="CSV with a company_name column")
+    parser.add_argument("--output", default="enriched_output2.csv", help="Where to write the enriched CSV")
+    parser.add_argument("--lookup-workers", type=int, default=DEFAULT_LOOKUP_WORKERS,
+                        help="Concurrent Wikipedia/Google lookups")
+    parser.add_argument("--analysis-workers", type=int, default=DEFAULT_ANALYSIS_WORKERS,
+                        help="Concurrent website scrapes + Gemini calls")
+    parser.add_argument("--parse-workers", type=int, default=parse_pool.DEFAULT_WORKERS,
+                        help="Processes for HTML parsing and text extraction (0 = parse in the fetch threads); "
+                             "set to the number of cores for large batches")
+    parser.add_argument("--batch-tokens", type=int, default=0,
+                        help="Send several companies per Gemini request, up to this many prompt tokens "
+                             f"(e.g. {DEFAULT_BATCH_TOKEN_BUDGET}); 0 analyzes one company per request")
+    parser.add_argument("--content-tokens", type=int, default=content_select.DEFAULT_TOKEN_BUDGET,
+                        help="Website-text token budget per company; the most business-relevant page "
+                             "sections are kept and navigation, banners and footers dropped")
+    parser.add_argument("--about-page", action="store_true", default=content_select.DEFAULT_ABOUT_PAGE,
+                        help="Also read each site's About page when selecting website text")
+    parser.add_argument("--cache", choices=cache.CACHE_MODES, default="use",
+                        help="use: reuse cached lookups, refresh: re-fetch and overwrite, bypass: no cache")
+    parser.add_argument("--cache-path", default=cache.DEFAULT_CACHE_PATH, help="SQLite cache file")
+    parser.add_argument("--store", nargs="?", const=entity_store.DEFAULT_STORE_PATH, metavar="PATH",
+                        help="Keep every field with its source and timestamp in this SQLite store "
+                             f"(default {entity_store.DEFAULT_STORE_PATH}) and only look up fields that are "
+                             "missing there or older than their --max-age")
+    parser.add_argument("--max-age", action="append", default=[], metavar="FIELD=DAYS",
+                        type=entity_store.parse_max_age,
+                        help="Refresh stored values of FIELD older than this, e.g. Industry=30 or "
+                             "'Company Size=60'; missing=7 waits a week before retrying values not found")
+    parser.add_argument("--export-store", metavar="PATH",
+                        help="Write every company in --store to PATH (.csv or .xlsx) and exit")
+    parser.add_argument("--export-sources", action="store_true",
+                        help="With --export-store, add a source and last-updated column per field")
+    parser.add_argument("--domain-index", default=domain_index.DEFAULT_INDEX_PATH, metavar="PATH",
+                        help="Local index of known company websites, consulted before any Google search")
+    parser.add_argument("--no-domain-guess", action="store_true", default=not domain_index.DEFAULT_GUESS,
+                        help="Don't try likely domains (name.com, name.io, ...) before searching Google")
+    parser.add_argument("--build-domain-index", action="store_true",
+                        help="Add every website in --store to --domain-index and exit")
+    parser.add_argument("--fetch-tiers", type=fetch_router.parse_tiers, default=fetch_router.TIERS,
+                        metavar="TIER,...",
+                        help="Ways to fetch websites, escalated in order requests, playwright, scrapingbee "
+                             "when a page is a JavaScript shell or blocked (403/429/503), e.g. requests,scrapingbee")
+    parser.add_argument("--fetch-routes", default=fetch_router.DEFAULT_ROUTES_PATH, metavar="PATH",
+                        help="Where the fetch tier that works for each website's domain is remembered")
+    parser.add_argument("--rate-limit", action="append", default=[], metavar="SERVICE=RPS[:CONCURRENCY]",
+                        type=rate_limiter.parse_limit,
+                        help="Override a request quota, e.g. gemini=2:4 or google=0.1 "
+                             "(services: wikipedia, google, scrapingbee, gemini, default or a website host)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read rows lazily and append each enriched row to the output as it finishes; "
+                             "an interrupted run resumes from its checkpoint")
+    parser.add_argument("--checkpoint", help="Checkpoint file for --stream (default: <output>.checkpoint)")
+    parser.add_argument("--restart", action="store_true",
+                        help="With --stream, ignore any existing checkpoint and start from the first row")
+    parser.add_argument("--metrics-report", metavar="PATH",
+                        help="Write per-stage timings and counters as JSON (refreshed at each --stream checkpoint)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve live metrics in Prometheus text format on http://127.0.0.1:PORT/metrics")
+    return parser.parse_args()
+
+
+def load_checkpoint(path, input_path):
+    """Return (rows_done, output_bytes) from a previous streaming run of the same input."""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, encoding="utf-8") as f:
+        state = json.load(f)
+    if os.path.abspath(state["input"]) != os.path.abspath(input_path):
+        raise SystemExit(f"❌ Checkpoint {path} belongs to {state['input']}; use --restart to start over.")
+    return state["rows_done"], state["output_bytes"]
+
+
+def save_checkpoint(path, input_path, rows_done, output_bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"input": input_path, "rows_done": rows_done, "output_bytes": output_bytes}, f)
+    os.replace(tmp_path, path)
+
+
+def run_streaming(args, store=None):
+    """Enrich args.input row by row, appending to args.output and checkpointing progress."""
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+    rows_done, output_bytes = (0, 0) if args.restart else load_checkpoint(checkpoint_path, args.input)
+    if rows_done and not os.path.exists(args.output):
+        raise SystemExit(f"❌ Checkpoint found but {args.output} is missing; use --restart to start over.")
+
+    engine = EnrichmentEngine(args.lookup_workers, args.analysis_workers,
+                              batch_token_budget=args.batch_tokens or None, store=store)
+
+    with open(args.input, newline="", encoding="utf-8-sig") as infile:
+        reader = csv.DictReader(infile)
+        if "company_name" not in (reader.fieldnames or []):
+            raise SystemExit("❌ Input CSV must contain a column named company_name.")
+        fieldnames = reader.fieldnames + [col for col in OUTPUT_COLUMNS if col not in reader.fieldnames]
+
+        if rows_done:
+            # Drop anything written after the last checkpoint; those rows are redone.
+            os.truncate(args.output, output_bytes)
+        with open(args.output, "a" if rows_done else "w", newline="", encoding="utf-8") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames, extrasaction="ignore")
+            if rows_done:
+                print(f"⏩ Resuming after {rows_done} completed rows")
+            else:
+                writer.writeheader()
+                outfile.flush()
+                save_checkpoint(checkpoint_path, args.input, 0, outfile.tell())
+
+            last_checkpoint = time.monotonic()
+            for row, result in engine.enrich(itertools.islice(reader, rows_done, None)):
+                row.update(result)
+                writer.writerow(row)
+                rows_done += 1
+                print(f"✔️ [{rows_done}] {row['company_name']}")
+                if time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    if store is not None:
+                        store.flush()
+                    outfile.flush()
+                    save_checkpoint(checkpoint_path, args.input, rows_done, outfile.tell())
+                    if args.metrics_report:
+                        metrics.write_report(args.metrics_report, rows_done=rows_done)
+                    last_checkpoint = time.monotonic()
+
+            outfile.flush()
+            save_checkpoint(checkpoint_path, args.input, rows_done, outfile.tell())
+
+    print(f"\n✅ Enrichment complete. {rows_done} rows saved to {args.output} (checkpoint: {checkpoint_path})")
+
+
+def run_batch(args, store=None):
+    import pandas as pd  # only the batch mode needs it; the streaming mode starts without it
+
+    # Load CSV
+    df = pd.read_csv(args.input)
+
+    def report(done, total, company):
+        print(f"✔️ [{done}/{total}] {company}")
+
+    enrich_dataframe(df, args.lookup_workers, args.analysis_workers, progress=report,
+                     batch_token_budget=args.batch_tokens or None, store=store)
+
+    df.to_csv(args.output, index=False)
+    print(f"\n✅ Enrichment complete. Output saved to {args.output}")
+
+
+def print_rate_limit_stats():
+    for service, stats in sorted(rate_limiter.stats().items()):
+        if service in rate_limiter.SERVICE_LIMITS:
+            print(f"⏱️ {service}: {stats['requests']} requests, {stats['throttles']} throttled, "
+                  f"waited {stats['total_wait_s']:.1f}s total")
+
+
+def export_store(args):
+    store = entity_store.EntityStore(args.store or entity_store.DEFAULT_STORE_PATH)
+    try:
+        rows = store.export(args.export_store, sources=args.export_sources)
+    except ValueError as e:
+        raise SystemExit(f"❌ {e}")
+    finally:
+        store.close()
+    print(f"✅ Exported {rows} companies from {store.path} to {args.export_store}")
+
+
+def build_domain_index(args):
+    store = entity_store.EntityStore(args.store or entity_store.DEFAULT_STORE_PATH)
+    index = domain_index.DomainIndex(args.domain_index)
+    try:
+        added = index.import_store(store)
+        print(f"✅ Indexed {added} websites from {store.path}; {index.count()} companies in {index.path}")
+    finally:
+        store.close()
+        index.close()
+
+
+def main():
+    args = parse_args()
+    if args.export_store:
+        export_store(args)
+        return
+    if args.build_domain_index:
+        build_domain_index(args)
+        return
+    cache.configure(path=args.cache_path, mode=args.cache)
+    domain_index.configure(path=args.domain_index, guess=not args.no_domain_guess)
+    fetch_router.configure(path=args.fetch_routes, tiers=args.fetch_tiers)
+    rate_limiter.configure(dict(args.rate_limit))
+    parse_pool.configure(args.parse_workers)
+    content_select.configure(token_budget=args.content_tokens, about_page=args.about_page)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    store = entity_store.EntityStore(args.store, dict(args.max_age)) if args.store else None
+    try:
+        if args.stream:
+            run_streaming(args, store)
+        else:
+            run_batch(args, store)
+    finally:
+        if store is not None:
+            store.close()
+    if store is not None:
+        counters = metrics.report()['counters']
+        fresh = counters.get('store_fields{result="fresh"}', 0)
+        refreshed = counters.get('store_fields{result="refreshed"}', 0)
+        print(f"🗄️ Store {store.path}: reused {fresh} fresh fields, looked up {refreshed}")
+    print_rate_limit_stats()
+    if args.metrics_report:
+        metrics.write_report(args.metrics_report, rate_limits=rate_limiter.stats())
+        print(f"📊 Metrics report saved to {args.metrics_report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""In-process counters and timers for the enrichment pipeline.
+
+External calls and parse steps are wrapped in ``span(name, **labels)``, events
+(cache hits, retries, fallbacks, tokens sent) are recorded with
+``count(name, value, **labels)`` and per-request sizes (prompt tokens) with
+``distribution(name, value, **labels)``. The totals can be written as a JSON run
+report or served in Prometheus text format while a long job runs.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'enrichment'
+
+# Upper bounds (seconds) of the span duration histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+# Upper bounds of the size distribution buckets (tokens, blocks...).
+SIZE_BUCKETS = (10, 50, 100, 250, 500, 1000, 1500, 2500, 5000, 10000, 25000, 50000, float('inf'))
+
+
+class Timer:
+    """Count, sum, max and bucketed distribution of one span's durations (or another size)."""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(bounds)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.bounds):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the histogram bucket that holds it."""
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for bound, n in zip(self.bounds, self.buckets):
+            if n and seen + n >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.max
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return name + '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _histogram_lines(metric, labels, bounds, count, total, buckets):
+    lines = []
+    cumulative = 0
+    for bound, n in zip(bounds, buckets):
+        cumulative += n
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f"{_series(metric + '_bucket', labels + (('le', le),))} {cumulative}")
+    lines.append(f"{_series(metric + '_sum', labels)} {total:.6f}")
+    lines.append(f"{_series(metric + '_count', labels)} {count}")
+    return lines
+
+
+class Metrics:
+    """Thread-safe registry of counters, span timers and size distributions keyed by name and labels."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._counters = {}
+        self._timers = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = Timer()
+            timer.observe(seconds)
+
+    def distribution(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            sizes = self._sizes.get(key)
+            if sizes is None:
+                sizes = self._sizes[key] = Timer(SIZE_BUCKETS)
+            sizes.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Time the block as ``name``; an exception also counts ``<name>_errors``."""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count(f"{name}_errors", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self):
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in sorted(self._counters.items())}
+            spans = {}
+            for (name, labels), timer in sorted(self._timers.items()):
+                spans[_series(name, labels)] = {
+                    'count': timer.count,
+                    'total_s': round(timer.total, 3),
+                    'avg_ms': round(timer.total / timer.count * 1000, 1),
+                    'p50_ms': round(timer.quantile(0.5) * 1000, 1),
+                    'p99_ms': round(timer.quantile(0.99) * 1000, 1),
+                    'max_ms': round(timer.max * 1000, 1),
+                }
+            distributions = {}
+            for (name, labels), sizes in sorted(self._sizes.items()):
+                distributions[_series(name, labels)] = {
+                    'count': sizes.count,
+                    'total': sizes.total,
+                    'avg': round(sizes.total / sizes.count, 1),
+                    'p50': round(sizes.quantile(0.5), 1),
+                    'p99': round(sizes.quantile(0.99), 1),
+                    'max': sizes.max,
+                }
+        return {'uptime_s': round(time.time() - self.started, 1), 'counters': counters, 'spans': spans,
+                'distributions': distributions}
+
+    def prometheus(self):
+        """Counters as ``<prefix>_<name>_total``, spans as ``<prefix>_<name>_seconds`` histograms
+        and distributions as ``<prefix>_<name>`` histograms."""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timers = sorted((key, (timer.count, timer.total, list(timer.buckets)))
+                            for key, timer in self._timers.items())
+            sizes = sorted((key, (h.count, h.total, list(h.buckets))) for key, h in self._sizes.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{_series(metric, labels)} {value}")
+        for (name, labels), (count, total, buckets) in timers:
+            metric = f"{PREFIX}_{name}_seconds"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            lines.extend(_histogram_lines(metric, labels, BUCKETS, count, total, buckets))
+        for (name, labels), (count, total, buckets) in sizes:
+            metric = f"{PREFIX}_{name}"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            lines.extend(_histogram_lines(metric, labels, SIZE_BUCKETS, count, total, buckets))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+            self._sizes.clear()
+            self.started = time.time()
+
+
+_metrics = Metrics()
+
+
+def count(name, value=1, **labels):
+    _metrics.count(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    _metrics.observe(name, seconds, **labels)
+
+
+def distribution(name, value, **labels):
+    _metrics.distribution(name, value, **labels)
+
+
+def span(name, **labels):
+    return _metrics.span(name, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of ``span``."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _metrics.span(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def report():
+    return _metrics.report()
+
+
+def prometheus_text():
+    return _metrics.prometheus()
+
+
+def reset():
+    _metrics.reset()
+
+
+def write_report(path, **extra):
+    """Write the current report (plus any ``extra`` top-level fields) as JSON, replacing ``path`` atomically."""
+    data = dict(extra, **report())
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port, host='127.0.0.1'):
+    """Serve ``/metrics`` in Prometheus text format from a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,73 @@
+"""Optional process pool for CPU-bound HTML parsing and text extraction.
+
+By default parse functions run in the calling thread. After
+``configure(workers=N)`` they run in N worker processes, so parsing is no
+longer serialised by the GIL behind the fetch threads: a fetch thread hands
+over the raw page bytes, blocks (without holding the GIL) and gets back only
+the small extracted result. Pages below ``MIN_OFFLOAD_BYTES`` are still
+parsed in-thread, where the process round trip would cost more than the parse.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+MIN_OFFLOAD_BYTES = 32 * 1024
+
+_workers = DEFAULT_WORKERS
+_pool = None
+_lock = threading.Lock()
+
+
+def configure(workers):
+    """Parse in ``workers`` processes; 0 parses in the calling thread."""
+    global _workers, _pool
+    with _lock:
+        workers = max(0, int(workers))
+        if workers == _workers:
+            return
+        _workers = workers
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None and _workers:
+            # spawn: forking a process full of fetch threads can copy locks held mid-request.
+            _pool = ProcessPoolExecutor(_workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def run(fn, data, *args, **kwargs):
+    """Return ``fn(data, *args, **kwargs)``, computed in a worker process when the pool is on.
+
+    ``fn`` must be a module-level function and ``data`` the page (str or
+    bytes) it parses; bytes are sent to the worker without re-encoding.
+    """
+    pool = _get_pool() if data is not None and len(data) >= MIN_OFFLOAD_BYTES else None
+    if pool is None:
+        return fn(data, *args, **kwargs)
+    try:
+        return pool.submit(fn, data, *args, **kwargs).result()
+    except BrokenProcessPool:
+        logging.warning("Parse worker process died; parsing in-thread from now on")
+        configure(0)
+        return fn(data, *args, **kwargs)
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+
+# Default quotas per upstream service: sustained requests/second, burst size
+# and maximum simultaneous requests. Any other website host gets 'default'.
+SERVICE_LIMITS = {
+    'wikipedia': {'rate': 20.0, 'burst': 20, 'concurrency': 16},
+    'google': {'rate': 0.2, 'burst': 1, 'concurrency': 1},
+    'scrapingbee': {'rate': 5.0, 'burst': 5, 'concurrency': 5},
+    'gemini': {'rate': 1.0, 'burst': 5, 'concurrency': 8},
+    'default': {'rate': 2.0, 'burst': 4, 'concurrency': 4},
+}
+
+HOST_SERVICES = {
+    'en.wikipedia.org': 'wikipedia',
+    'app.scrapingbee.com': 'scrapingbee',
+}
+
+# After a 429 the rate is halved (never below this fraction of the configured
+# rate), then recovers by this fraction of the configured rate per success.
+MIN_RATE_FRACTION = 0.05
+RECOVERY_FRACTION = 0.05
+# How often a coroutine waiting for a free concurrency slot checks again.
+ASYNC_POLL_INTERVAL = 0.05
+
+
+class ServiceLimiter:
+    """Token bucket plus concurrency cap for one service, adapting its rate to 429s."""
+
+    def __init__(self, name, rate, burst, concurrency):
+        self.name = name
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.concurrency = max(1, concurrency)
+        self.tokens = float(self.burst)
+        self.in_flight = 0
+        self.waiting = 0
+        self.paused_until = 0.0
+        self.requests = 0
+        self.throttles = 0
+        self.total_wait = 0.0
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_take(self):
+        """Take a token and a concurrency slot: 0 on success, else seconds to wait (None: until a release)."""
+        now = time.monotonic()
+        self._refill(now)
+        if self.in_flight >= self.concurrency:
+            return None
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def _acquired(self, start):
+        self.requests += 1
+        waited = time.monotonic() - start
+        self.total_wait += waited
+        return waited
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+            try:
+                while True:
+                    timeout = self._try_take()
+                    if timeout == 0:
+                        break
+                    self._cond.wait(timeout)
+            finally:
+                self.waiting -= 1
+            waited = self._acquired(start)
+        metrics.observe('rate_limit_wait', waited, service=service_label(self.name))
+
+    async def acquire_async(self):
+        """``acquire`` for coroutines: waits with asyncio.sleep instead of blocking the event loop."""
+        start = time.monotonic()
+        with self._cond:
+            self.waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    timeout = self._try_take()
+                    if timeout == 0:
+                        waited = self._acquired(start)
+                        break
+                await asyncio.sleep(ASYNC_POLL_INTERVAL if timeout is None else timeout)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+        metrics.observe('rate_limit_wait', waited, service=service_label(self.name))
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def throttled(self, retry_after=None):
+        """Record a 429 / quota error: halve the rate and pause for Retry-After if given."""
+        metrics.count('throttles', service=service_label(self.name))
+        with self._cond:
+            self.throttles += 1
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            logging.warning(f"{self.name} throttled us; slowing to {self.rate:.2f} req/s")
+
+    def succeeded(self):
+        with self._cond:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate': round(self.rate, 3),
+                'in_flight': self.in_flight,
+                'queue_depth': self.waiting,
+                'requests': self.requests,
+                'throttles': self.throttles,
+                'total_wait_s': round(self.total_wait, 3),
+                'avg_wait_s': round(self.total_wait / self.requests, 3) if self.requests else 0.0,
+            }
+
+
+class Scheduler:
+    """Registry of per-service limiters shared by every worker thread."""
+
+    def __init__(self, limits=None):
+        self.limits = {name: dict(values) for name, values in SERVICE_LIMITS.items()}
+        for name, values in (limits or {}).items():
+            self.limits.setdefault(name, dict(self.limits['default'])).update(values)
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, service):
+        with self._lock:
+            limiter = self._limiters.get(service)
+            if limiter is None:
+                limits = self.limits.get(service, self.limits['default'])
+                limiter = ServiceLimiter(service, **limits)
+                self._limiters[service] = limiter
+            return limiter
+
+    @contextmanager
+    def slot(self, service):
+        limiter = self.limiter(service)
+        limiter.acquire()
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    @asynccontextmanager
+    async def async_slot(self, service):
+        limiter = self.limiter(service)
+        await limiter.acquire_async()
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+def service_for_host(host):
+    """Service name for a hostname: a known upstream, or the host itself for plain websites."""
+    host = host.lower()
+    return HOST_SERVICES.get(host, host)
+
+
+def service_label(service):
+    """Metrics label for a service: its name for known upstreams, 'website' for any site host."""
+    return service if service in SERVICE_LIMITS else 'website'
+
+
+def parse_limit(spec):
+    """Parse a CLI spec like ``gemini=2`` or ``gemini=2:4`` into (service, limits)."""
+    try:
+        service, values = spec.split('=', 1)
+        rate, _, concurrency = values.partition(':')
+        limits = {'rate': float(rate), 'burst': max(1, int(float(rate)))}
+        if concurrency:
+            limits['concurrency'] = int(concurrency)
+    except ValueError:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected SERVICE=RPS[:CONCURRENCY]")
+    return service.strip(), limits
+
+
+_scheduler = Scheduler()
+
+
+def configure(limits):
+    """Replace the shared scheduler with one using ``{service: {'rate', 'burst', 'concurrency'}}`` overrides."""
+    global _scheduler
+    _scheduler = Scheduler(limits)
+
+
+def slot(service):
+    return _scheduler.slot(service)
+
+
+def async_slot(service):
+    """``async with`` form of ``slot``, sharing the same quotas as the worker threads."""
+    return _scheduler.async_slot(service)
+
+
+def limiter(service):
+    return _scheduler.limiter(service)
+
+
+def stats():
+    return _scheduler.stats()
@@ -1,11 +1,15 @@
-import wikipediaapi
-import requests
-from bs4 import BeautifulSoup
-from googlesearch import search
+import domain_index
+import http_client
+import rate_limiter
+import html_extract
+import metrics
+import parse_pool
+import wiki_bulk
 import re
-import time
+import threading
 import logging
 from urllib.parse import urlparse
+from cache import cached
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -30,105 +34,193 @@ def fix_url(url):
         url = 'https://' + url
     return url
 
-def fetch_url_with_retries(url, retries=3, backoff=2):
-    """Fetch URL content with retries and exponential backoff."""
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
-            if attempt < retries - 1:
-                sleep_time = backoff ** attempt
-                logging.warning(f"Request failed ({e}), retrying in {sleep_time}s...")
-                time.sleep(sleep_time)
+def fetch_url_with_retries(url, retries=3):
+    """Fetch URL through the shared pooled client, retrying with jittered backoff; returns the response."""
+    return http_client.get(url, retries=retries, timeout=10)
+
+def infobox_html_fields(html, encoding=None):
+    """Metadata fields from the infobox of a rendered Wikipedia article (CPU-bound; may run in parse_pool)."""
+    fields = {}
+    for header_text, data_text, href in html_extract.infobox_rows(html, encoding):
+        key = header_text.strip().lower()
+        val = clean_text(data_text)
+
+        if 'headquarters' in key or 'headquarter' in key:
+            fields['HQ Location'] = val
+        elif 'industry' in key:
+            fields['Industry'] = val
+        elif 'number of employees' in key or 'employees' in key:
+            fields['Company Size'] = val
+        elif 'website' in key:
+            if href:
+                fields['Website'] = fix_url(href)
             else:
-                logging.error(f"Request failed after {retries} attempts: {e}")
-                raise e
+                fields['Website'] = val
+    return fields
+
+# Keyword marking the line of the plain article text that holds each field.
+TEXT_FIELD_KEYWORDS = {
+    'Website': 'website',
+    'Industry': 'industry',
+    'Company Size': 'employee',
+    'HQ Location': 'headquarter',
+}
+
+# Where each metadata value came from, kept per field in info['Sources'] (and the entity store).
+SOURCE_INFOBOX = 'wikipedia_infobox'
+SOURCE_WIKI_TEXT = 'wikipedia_text'
+SOURCE_GOOGLE = 'google_search'
+
+def record_fields(info, fields, source):
+    """Copy ``fields`` into ``info``, noting ``source`` for each value that was actually found."""
+    for field, value in fields.items():
+        info[field] = value
+        if value and value != 'N/A':
+            info['Sources'][field] = source
+
+def scan_page_text(page_text, fields):
+    """Find ``fields`` in the plain article text: the first matching line for each, in one pass."""
+    found = {}
+    remaining = list(fields)
+    for line in page_text.lower().split('\n'):
+        for field in remaining:
+            if TEXT_FIELD_KEYWORDS[field] not in line:
+                continue
+            if field == 'Website':
+                possible_url = re.search(r'https?://\S+', line)
+                if possible_url:
+                    found[field] = possible_url.group()
+            else:
+                found[field] = clean_text(line)
+        if found:
+            remaining = [field for field in remaining if field not in found]
+            if not remaining:
+                break
+    return found
+
+def search(query, **kwargs):
+    """googlesearch.search, imported on first use (only companies without a Wikipedia website need it)."""
+    from googlesearch import search as google_search
+    return google_search(query, **kwargs)
+
+def search_website(company_name):
+    """First Google result whose domain matches the company name, or 'N/A'; raises if the search fails."""
+    query = f"{company_name} official website"
+    with rate_limiter.slot('google') as limiter:
+        try:
+            with metrics.span('google_search'):
+                results = list(search(query, num_results=5))
+        except Exception as e:
+            if '429' in str(e):
+                limiter.throttled()
+            raise
+    for url in results:
+        if domain_index.matches_name(company_name, url):
+            logging.info(f"Google Search found website: {url}")
+            return url
+    return 'N/A'
+
+def resolve_website(company_name):
+    """(website, source) for a company Wikipedia gave no website for.
 
-def google_search_website(company_name):
-    """Search Google for the company's official website."""
+    Tries the local domain index, then checked domain guesses, and only
+    then Google Search; whatever is found is added to the index.
+    """
+    index = domain_index.get_index()
+    found = index.lookup(company_name)
+    if found is not None:
+        website, via = found
+        metrics.count('website_resolution', via=via)
+        return website, domain_index.SOURCE_INDEX
+    if domain_index.guessing_enabled():
+        website = domain_index.guess_website(company_name)
+        if website:
+            metrics.count('website_resolution', via='guess')
+            index.record(company_name, website, domain_index.SOURCE_GUESS)
+            return website, domain_index.SOURCE_GUESS
+    metrics.count('website_resolution', via='search')
+    metrics.count('fallbacks', kind='google_search')
     try:
-        query = f"{company_name} official website"
-        for url in search(query, num_results=5):
-            if company_name.lower() in url.lower():
-                logging.info(f"Google Search found website: {url}")
-                return url
+        website = search_website(company_name)
     except Exception as e:
         logging.warning(f"Google Search failed for {company_name}: {e}")
-    return 'N/A'
+        return 'N/A', SOURCE_GOOGLE
+    index.record(company_name, website, SOURCE_GOOGLE)
+    return website, SOURCE_GOOGLE
+
+def learn_website(info, company_name, wiki_title):
+    """Add a website found on Wikipedia to the domain index, under the company and article names."""
+    source = info['Sources'].get('Website')
+    if source in (SOURCE_INFOBOX, SOURCE_WIKI_TEXT):
+        domain_index.get_index().record(company_name, info['Website'], source, aliases=(wiki_title,))
+
+_wiki = None
+_wiki_lock = threading.Lock()
+
+def wiki_client():
+    """One shared Wikipedia client so its connections are kept alive between companies."""
+    global _wiki
+    with _wiki_lock:
+        if _wiki is None:
+            import wikipediaapi
+            _wiki = wikipediaapi.Wikipedia(
+                language='en',
+                user_agent='TaskLeadEnrichmentBot/1.0 (aravind@example.com)'
+            )
+        return _wiki
 
+@cached(
+    'details',
+    key=lambda company_name: company_name.strip().casefold(),
+    store_if=lambda info: any(info[field] != 'N/A' for field in TEXT_FIELD_KEYWORDS)
+)
+@metrics.timed('company_details')
 def get_company_details(company_name):
     info = {
         'Company Name': company_name,
         'Website': 'N/A',
         'Industry': 'N/A',
         'Company Size': 'N/A',
-        'HQ Location': 'N/A'
+        'HQ Location': 'N/A',
+        'Sources': {},
     }
 
-    wiki = wikipediaapi.Wikipedia(
-        language='en',
-        user_agent='TaskLeadEnrichmentBot/1.0 (aravind@example.com)'
-    )
-    page = wiki.page(company_name)
-
-    if not page.exists():
-        logging.info(f"Wikipedia page not found for {company_name}, trying Google Search fallback")
-        info['Website'] = google_search_website(company_name)
+    # Existence, redirects and lead wikitext come from a bulk query (usually prefetched).
+    wiki_page = wiki_bulk.take(company_name)
+    if not wiki_page.exists:
+        logging.info(f"Wikipedia page not found for {company_name}, resolving its website")
+        website, source = resolve_website(company_name)
+        record_fields(info, {'Website': website}, source)
         return info
 
-    url = page.fullurl
-    try:
-        html = fetch_url_with_retries(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        infobox = soup.find('table', {'class': 'infobox'})
-        if infobox:
-            rows = infobox.find_all('tr')
-            for row in rows:
-                header = row.find('th')
-                data = row.find('td')
-                if not header or not data:
-                    continue
-
-                key = header.text.strip().lower()
-                val = clean_text(data.text)
-
-                if 'headquarters' in key or 'headquarter' in key:
-                    info['HQ Location'] = val
-                elif 'industry' in key:
-                    info['Industry'] = val
-                elif 'number of employees' in key or 'employees' in key:
-                    info['Company Size'] = val
-                elif 'website' in key:
-                    link = data.find('a')
-                    if link and link.has_attr('href'):
-                        info['Website'] = fix_url(link['href'])
-                    else:
-                        info['Website'] = val
-    except Exception as e:
-        logging.warning(f"Error parsing infobox for {company_name}: {e}")
+    with metrics.span('parse', step='infobox_wikitext'):
+        fields, complete = parse_pool.run(wiki_bulk.infobox_details, wiki_page.wikitext)
+    if complete:
+        record_fields(info, {field: fix_url(value) if field == 'Website' else clean_text(value)
+                             for field, value in fields.items()}, SOURCE_INFOBOX)
+    else:
+        metrics.count('fallbacks', kind='infobox_html')
+        try:
+            response = fetch_url_with_retries(wiki_page.fullurl)
+            with metrics.span('parse', step='infobox_html'):
+                record_fields(info, parse_pool.run(infobox_html_fields, response.content, response.encoding),
+                              SOURCE_INFOBOX)
+        except Exception as e:
+            logging.warning(f"Error parsing infobox for {company_name}: {e}")
 
     # Fallback to parse raw Wikipedia text if still missing fields (optional, can be omitted)
-    for field in ['Website', 'Industry', 'Company Size', 'HQ Location']:
-        if info[field] == 'N/A':
-            content = page.text.lower()
-            lines = content.split('\n')
-            for line in lines:
-                if field == 'Website' and 'website' in line and info['Website'] == 'N/A':
-                    possible_url = re.findall(r'https?://\S+', line)
-                    if possible_url:
-                        info['Website'] = possible_url[0]
-                elif field == 'Industry' and 'industry' in line and info['Industry'] == 'N/A':
-                    info['Industry'] = clean_text(line)
-                elif field == 'Company Size' and ('employee' in line or 'number of employees' in line) and info['Company Size'] == 'N/A':
-                    info['Company Size'] = clean_text(line)
-                elif field == 'HQ Location' and ('headquarter' in line or 'headquarters' in line) and info['HQ Location'] == 'N/A':
-                    info['HQ Location'] = clean_text(line)
-
-    # Final sanity check for website: if still 'N/A', try Google search once
+    missing = [field for field in TEXT_FIELD_KEYWORDS if info[field] == 'N/A']
+    if missing:
+        metrics.count('fallbacks', kind='wikipedia_text')
+        with rate_limiter.slot('wikipedia'), metrics.span('wikipedia_text'):
+            page_text = wiki_client().page(wiki_page.title).text
+        with metrics.span('parse', step='wikipedia_text'):
+            record_fields(info, parse_pool.run(scan_page_text, page_text, missing), SOURCE_WIKI_TEXT)
+
+    learn_website(info, company_name, wiki_page.title)
     if info['Website'] == 'N/A':
-        logging.info(f"Using Google Search fallback for {company_name} to find website")
-        info['Website'] = google_search_website(company_name)
+        logging.info(f"No website on Wikipedia for {company_name}, resolving it")
+        website, source = resolve_website(company_name)
+        record_fields(info, {'Website': website}, source)
 
     return info
@@ -0,0 +1,314 @@
+"""Bulk Wikipedia resolution through the MediaWiki query API.
+
+One request resolves existence, title normalisation, redirects, canonical
+URL and lead-section wikitext for up to 50 titles. For ``{{Infobox company}}``
+pages whose relevant fields are plain enough to render faithfully from
+wikitext, get_company_details no longer has to download the article HTML;
+anything else (other infobox types, Wikidata-driven or templated values)
+is flagged so the caller falls back to the rendered-HTML path.
+"""
+import html
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import http_client
+import metrics
+
+API_URL = os.getenv("WIKIPEDIA_API_URL", "https://en.wikipedia.org/w/api.php")
+USER_AGENT = 'TaskLeadEnrichmentBot/1.0 (aravind@example.com)'
+BATCH_SIZE = 50
+MAX_RESPONSE_BYTES = 50 * 1024 * 1024
+MAX_PREFETCHED_PAGES = 2000
+
+INFOBOX_TEMPLATES = {'company'}
+HQ_PARAMS = (('hq_location', 'location'), ('hq_location_city', 'location_city'),
+             ('hq_location_country', 'location_country'))
+WEBSITE_PARAMS = ('website', 'homepage', 'url')
+
+_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_REF = re.compile(r'<ref\b[^>/]*/>|<ref\b[^>]*>.*?</ref\s*>', re.DOTALL | re.IGNORECASE)
+_WIKILINK = re.compile(r'\[\[([^\[\]|]+)(?:\|([^\[\]]*))?\]\]')
+_EXTERNAL_LINK = re.compile(r'\[(https?://[^\s\]]+)\s+([^\]]+)\]')
+_BARE_URL = re.compile(r'^(?:https?:)?//\S+$')
+_INFOBOX_START = re.compile(r'\{\{\s*infobox[ _]+([^|}\n<]+)', re.IGNORECASE)
+
+
+class WikiPage:
+    """What one bulk query knows about a title."""
+
+    __slots__ = ('title', 'exists', 'fullurl', 'wikitext')
+
+    def __init__(self, title, exists=False, fullurl=None, wikitext=''):
+        self.title = title
+        self.exists = exists
+        self.fullurl = fullurl
+        self.wikitext = wikitext
+
+    def __repr__(self):
+        return f"WikiPage({self.title!r}, exists={self.exists})"
+
+
+def query_params(titles):
+    """MediaWiki API parameters resolving <=50 titles with their URL and lead-section wikitext."""
+    return {
+        'action': 'query',
+        'format': 'json',
+        'formatversion': 2,
+        'redirects': 1,
+        'prop': 'info|revisions',
+        'inprop': 'url',
+        'rvprop': 'content',
+        'rvslots': 'main',
+        'rvsection': 0,
+        'titles': '|'.join(titles),
+    }
+
+
+def new_merged():
+    return {'normalized': [], 'redirects': [], 'pages': {}}
+
+
+def merge_query(merged, data):
+    """Fold one API response into ``merged``; returns its continuation parameters, or None when done."""
+    query = data.get('query', {})
+    merged['normalized'] += query.get('normalized', [])
+    merged['redirects'] += query.get('redirects', [])
+    for page in query.get('pages', []):
+        known = merged['pages'].setdefault(page['title'], page)
+        if known is not page and page.get('revisions'):
+            known['revisions'] = page['revisions']
+    return data.get('continue')
+
+
+def resolve_batch(batch, merged):
+    """{input title: WikiPage} for one batch from its merged query result."""
+    results = {}
+    normalized = {n['from']: n['to'] for n in merged['normalized']}
+    redirects = {r['from']: r['to'] for r in merged['redirects']}
+    for title in batch:
+        resolved = normalized.get(title, title)
+        resolved = redirects.get(resolved, resolved)
+        page = merged['pages'].get(resolved)
+        if not page or page.get('missing') or page.get('invalid'):
+            results[title] = WikiPage(resolved)
+            continue
+        revisions = page.get('revisions') or [{}]
+        wikitext = revisions[0].get('slots', {}).get('main', {}).get('content', '')
+        results[title] = WikiPage(page['title'], True, page.get('fullurl'), wikitext)
+    return results
+
+
+def unique_titles(titles):
+    return list(dict.fromkeys(t for t in titles if t and t.strip()))
+
+
+def _query(titles):
+    """Run one query for <=50 titles, following API continuation; returns the merged formatversion=2 result."""
+    params = query_params(titles)
+    merged = new_merged()
+    while True:
+        response = http_client.get(API_URL, params=params, headers={'User-Agent': USER_AGENT},
+                                   timeout=30, max_bytes=MAX_RESPONSE_BYTES)
+        more = merge_query(merged, response.json())
+        if not more:
+            return merged
+        params.update(more)
+
+
+def fetch_pages(titles):
+    """Resolve ``titles`` in batches of 50; returns {input title: WikiPage}."""
+    results = {}
+    unique = unique_titles(titles)
+    for start in range(0, len(unique), BATCH_SIZE):
+        batch = unique[start:start + BATCH_SIZE]
+        metrics.count('wikipedia_titles', len(batch))
+        results.update(resolve_batch(batch, _query(batch)))
+    return results
+
+
+def _template_end(text, start):
+    """Index just past the template opened by the '{{' at ``start``."""
+    depth = 0
+    i = start
+    while i < len(text) - 1:
+        pair = text[i:i + 2]
+        if pair == '{{':
+            depth += 1
+            i += 2
+        elif pair == '}}':
+            depth -= 1
+            i += 2
+            if depth == 0:
+                return i
+        else:
+            i += 1
+    return len(text)
+
+
+def _split_params(body):
+    """Split a template body on top-level '|' (ignoring pipes in nested templates and links)."""
+    parts, depth, current = [], 0, []
+    i = 0
+    while i < len(body):
+        pair = body[i:i + 2]
+        if pair in ('{{', '[['):
+            depth += 1
+            current.append(pair)
+            i += 2
+            continue
+        if pair in ('}}', ']]'):
+            depth -= 1
+            current.append(pair)
+            i += 2
+            continue
+        if body[i] == '|' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(body[i])
+        i += 1
+    parts.append(''.join(current))
+    return parts
+
+
+def parse_infobox(wikitext):
+    """Return (template name, {param: raw value}) for the first infobox, or (None, {})."""
+    wikitext = _COMMENT.sub('', wikitext or '')
+    match = _INFOBOX_START.search(wikitext)
+    if not match:
+        return None, {}
+    end = _template_end(wikitext, match.start())
+    body = wikitext[match.start() + 2:end - 2]
+    params = {}
+    for part in _split_params(body)[1:]:
+        name, sep, value = part.partition('=')
+        if sep:
+            params[name.strip().lower()] = value.strip()
+    return match.group(1).strip().lower(), params
+
+
+def render_value(value):
+    """Render simple wikitext to the text MediaWiki would show, or None if it is not simple."""
+    value = _REF.sub('', value)
+    value = re.sub(r'\{\{\s*nowrap\s*\|([^{}|]*)\}\}', r'\1', value, flags=re.IGNORECASE)
+    if '{{' in value or '<' in value or '[[File:' in value or '[[Image:' in value:
+        return None
+    value = _WIKILINK.sub(lambda m: m.group(2) if m.group(2) is not None else m.group(1), value)
+    value = _EXTERNAL_LINK.sub(r'\2', value)
+    if '[' in value or ']' in value:
+        return None
+    value = value.replace("'''", '').replace("''", '')
+    return html.unescape(value).strip()
+
+
+def render_website(value):
+    """Return the href the Website row would link to, or None if it can't be known from wikitext."""
+    value = _REF.sub('', value).strip()
+    match = re.fullmatch(r'\{\{\s*url\s*\|\s*(?:1\s*=\s*)?([^|{}]+?)\s*(?:\|[^{}]*)?\}\}', value, re.IGNORECASE)
+    if match:
+        url = match.group(1)
+        return url if re.match(r'^https?://', url, re.IGNORECASE) else None
+    match = _EXTERNAL_LINK.fullmatch(value)
+    if match:
+        return match.group(1)
+    if _BARE_URL.match(value):
+        return value
+    return None
+
+
+def infobox_details(wikitext):
+    """Map an ``{{Infobox company}}`` to get_company_details fields.
+
+    Returns ``(fields, complete)``. ``complete`` is False when the rendered
+    infobox could differ from what can be read off the wikitext; callers
+    should then parse the article HTML instead.
+    """
+    name, params = parse_infobox(wikitext)
+    if name not in INFOBOX_TEMPLATES:
+        return {}, False
+
+    fields = {}
+    raw = params.get('industry', '')
+    if raw:
+        industry = render_value(raw)
+        if industry is None:
+            return {}, False
+        fields['Industry'] = industry
+
+    hq_parts = []
+    for aliases in HQ_PARAMS:
+        raw = next((params[a] for a in aliases if params.get(a)), '')
+        if raw:
+            part = render_value(raw)
+            if part is None:
+                return {}, False
+            hq_parts.append(part)
+    if hq_parts:
+        fields['HQ Location'] = ', '.join(hq_parts)
+
+    raw = params.get('num_employees', '')
+    if raw:
+        size = render_value(raw)
+        year = render_value(params.get('num_employees_year', ''))
+        if size is None or year is None:
+            return {}, False
+        fields['Company Size'] = f"{size} ({year})" if year else size
+
+    raw = next((params[p] for p in WEBSITE_PARAMS if params.get(p)), '')
+    website = render_website(raw) if raw else None
+    if website is None:
+        # Empty website rows are filled from Wikidata when rendered; templated ones need rendering.
+        return {}, False
+    fields['Website'] = website
+    return fields, True
+
+
+class WikiResolver:
+    """Holds bulk-fetched pages until get_company_details picks them up.
+
+    Pages that are never picked up (e.g. rows served from cache) are dropped
+    oldest-first beyond ``max_pages``.
+    """
+
+    def __init__(self, max_pages=MAX_PREFETCHED_PAGES):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, titles):
+        with self._lock:
+            missing = [t for t in titles if t not in self._pages]
+        if not missing:
+            return
+        try:
+            pages = fetch_pages(missing)
+        except Exception as e:
+            logging.warning(f"Bulk Wikipedia lookup failed for {len(missing)} titles: {e}")
+            return
+        with self._lock:
+            self._pages.update(pages)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def take(self, title):
+        """Return and forget the prefetched page for ``title``, fetching it alone if needed."""
+        with self._lock:
+            page = self._pages.pop(title, None)
+        metrics.count('wikipedia_prefetch', result='miss' if page is None else 'hit')
+        if page is None:
+            page = fetch_pages([title]).get(title, WikiPage(title))
+        return page
+
+
+_resolver = WikiResolver()
+
+
+def prefetch(titles):
+    _resolver.prefetch(titles)
+
+
+def take(title):
+    return _resolver.take(title)